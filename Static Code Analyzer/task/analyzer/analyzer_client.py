@@ -0,0 +1,89 @@
+"""Thin client for a `code_analyzer.py --serve` daemon.
+
+Takes the same arguments as code_analyzer.py and prints the same output, but
+leaves the work to the daemon, so a run doesn't pay for starting Python's
+workers and compiling the checks. Only the standard library modules needed
+to talk to the socket are imported. Without a daemon listening, the analysis
+runs in this process as if code_analyzer.py had been called.
+"""
+
+import base64
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+
+
+def default_socket_path():
+    # Same as code_analyzer.default_socket_path()
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"code_analyzer-{os.getuid()}", "daemon.sock")
+
+
+def socket_path(argv):
+    for index, arg in enumerate(argv):
+        if arg == "--socket" and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith("--socket="):
+            return arg.partition("=")[2]
+    return default_socket_path()
+
+
+def is_own_socket(path):
+    """Whether path is a socket of this user, whose daemon may be trusted."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+
+def ask_daemon(argv):
+    """The daemon's exit status for argv, or None if no daemon is listening."""
+    if not hasattr(socket, "AF_UNIX") or "--serve" in argv:
+        return None
+    path = socket_path(argv)
+    if not is_own_socket(path):
+        # Someone else's daemon would be handed our files and our output
+        if os.path.lexists(path):
+            print(f"{path}: not a socket of yours, ignored", file=sys.stderr)
+        return None
+    connection = socket.socket(socket.AF_UNIX)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return None
+
+    request = {"cwd": os.getcwd(), "argv": argv}
+    if "-" in argv or "--files-from=-" in argv:
+        request["stdin"] = base64.b64encode(sys.stdin.buffer.read()).decode()
+    with connection, connection.makefile("rb") as replies:
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        for line in replies:
+            reply = json.loads(line)
+            if "exit" in reply:
+                return reply["exit"]
+            if "stdout" in reply:
+                sys.stdout.write(reply["stdout"])
+            else:
+                sys.stderr.write(reply["stderr"])
+    # Part of the output may be printed already, so don't start over
+    print("the daemon closed the connection before finishing", file=sys.stderr)
+    return 1
+
+
+def main():
+    argv = sys.argv[1:]
+    status = ask_daemon(argv)
+    if status is None:
+        import code_analyzer
+
+        status = code_analyzer.main(argv)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
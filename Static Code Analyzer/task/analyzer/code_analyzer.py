@@ -1,7 +1,37 @@
 import argparse
 import ast
+import base64
+import fnmatch
+import hashlib
+import heapq
+import io
+import json
+import mmap
 import os
+import pathlib
 import re
+import shutil
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import tokenize
+import traceback
+import urllib.parse
+import zipfile
+import zlib
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext, redirect_stderr, redirect_stdout
+from functools import partial
+from itertools import chain, islice
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 """Exercise: figure out a way to avoid having multiple functions with the same list of
 arguments...
@@ -9,295 +39,3275 @@ arguments...
 ...actually scratch that. Figure out a way to make the code not disgusting, because 
 holly cow isn't this an absolute mess. I don't even know where to begin."""
 
+# Bump whenever a check changes what it reports, it invalidates cached results
+ANALYZER_VERSION = "6"
+RULE_CODES = tuple(f"S{number:03}" for number in range(1, 13))
+
+DEFAULT_CACHE_DIR = ".analyzer_cache"
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+# Entries are spread evenly over the 256 directories named by the first two hex
+# digits of their key, the size of these tells about that of the whole cache
+CACHE_SAMPLE_DIRS = ("00", "40", "80", "c0")
+
+DEFAULT_EXTENSIONS = (".py",)
+# Analyzed member by member, without extracting them
+ARCHIVE_SUFFIXES = (".whl", ".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# Directories that never hold sources worth checking, matched like --exclude
+DEFAULT_EXCLUDE = (
+    ".git",
+    ".hg",
+    ".svn",
+    "__pycache__",
+    "venv",
+    ".venv",
+    ".tox",
+    ".nox",
+    "node_modules",
+    DEFAULT_CACHE_DIR,
+)
+
+# Characters of report text collected before a write to the output stream
+REPORT_BUFFER_SIZE = 64 * 1024
+
+# Per-file limits, past them only the line and token checks run. The syntax
+# tree is walked without recursing, so its depth isn't limited by default.
+DEFAULT_MAX_FILE_SIZE = 10 * 1024 * 1024
+DEFAULT_FILE_TIMEOUT = 30.0
+DEFAULT_MAX_DEPTH = None
+
+# Files at least this big are memory-mapped rather than read into memory
+MMAP_MIN_SIZE = 1024 * 1024
+# When files are analyzed in this process, how many of the next ones are being
+# read on how many threads meanwhile, see analyze_paths()
+READ_AHEAD = 16
+READ_AHEAD_THREADS = 4
+# Files of the same size are compared by this many first bytes before hashing
+HEAD_SIZE = 4096
+
+# With incremental analysis, smaller files are still analyzed as a whole, there's
+# too little to save
+INCREMENTAL_MIN_SIZE = 32 * 1024
+# Blocks in a row that may be joined to make one that parses, see check_blocks()
+MAX_BLOCK_MERGES = 16
+
+# Bumped whenever what SymbolIndex stores changes
+INDEX_VERSION = "2"
+SYMBOL_KINDS = ("module", "class", "function", "variable", "import")
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+
+WATCH_INTERVAL = 0.2
+DEFAULT_DEBOUNCE = 0.2
+# A directory listing is reused while the directory's mtime stays the same, but
+# only once it's this much older than the listing: coarse timestamps can't tell
+# a change right after the listing from the listing (2 s on FAT)
+LISTING_MTIME_SLACK = 2 * 10**9
+
 MUTABLE_LITERAL_NODES = (ast.List, ast.Dict, ast.Set)
 
+# Filled in with Diagnostic.args when a finding is printed
+MESSAGES = {
+    "S001": "Line length over 79 characters",
+    "S002": "Indentation is not a multiple of four",
+    "S003": "Unnecessary semicolon after a statement",
+    "S004": "Less than two spaces before inline comment",
+    "S005": "TODO found",
+    "S006": "More than two blank lines preceding a code line",
+    "S007": "Too many spaces after '{}'",
+    "S008": "Class name '{}' should be written in CamelCase",
+    "S009": "Function name '{}' should be written in snake_case",
+    "S010": "Argument name '{}' should be written in snake_case",
+    "S011": "Variable '{}' should be written in snake_case",
+    "S012": "The default argument '{}' value {} is mutable",
+}
 
-class MutableArgumentVisitor(ast.NodeVisitor):
-    def __init__(self, path: str):
-        self._error_messages: list[tuple[int, str]] = []
-        self._path = path
 
-    def visit_FunctionDef(self, node):
-        self._check_mutable_arguments(node)
-        self.generic_visit(node)
+class Diagnostic(NamedTuple):
+    """A finding, without its path so it can be cached by file content.
 
-    def visit_ClassDef(self, node):
-        for sub_node in node.body:
-            if isinstance(sub_node, ast.FunctionDef):
-                self._check_mutable_arguments(sub_node)
-        self.generic_visit(node)
+    Turned into text only when it's reported, see format_diagnostic().
+    """
 
-    def _check_mutable_arguments(self, node):
-        for arg in node.args.args:
-            fund_bad_arg_name = False
-            found_mutable_argument = False
+    line: int
+    col: int  # 0-based, in characters of the line
+    code: str
+    args: tuple = ()
 
-            if not is_snake_case(arg.arg) and not fund_bad_arg_name:
-                error_msg = error_message(
-                    node.lineno,
-                    "S010",
-                    f"Argument name '{arg.arg}' should be written in snake_case",
-                    self._path,
-                )
-                self._error_messages.append((node.lineno, error_msg))
-                fund_bad_arg_name = True
-
-            # Check if the default value is a mutable literal type
-            arg_value = None
-            arg_end = arg.end_col_offset
-            for default in node.args.defaults:
-                # Terrible hack, works only if there are no spaces
-                # around the assignment operator
-                if default.col_offset == arg_end + 1:
-                    arg_value = default
-
-            if (
-                isinstance(arg_value, MUTABLE_LITERAL_NODES)
-                and not found_mutable_argument
-            ):
-                # The type checker appears to be wrong about arg_vlue usage
-                # noinspection PyTypeChecker
-                error_msg = error_message(
-                    node.lineno,
-                    "S012",
-                    f"The default argument '{arg.arg}' "
-                    f"value {ast.literal_eval(arg_value)} is mutable",
-                    self._path,
-                )
-                self._error_messages.append((node.lineno, error_msg))
-                found_mutable_argument = True
 
-            if found_mutable_argument and fund_bad_arg_name:
-                break
+class AnalysisOptions(NamedTuple):
+    """What to check and how, the same for every analyzed file."""
 
-    def visit_Assign(self, node):
-        for target in node.targets:
-            if isinstance(target, ast.Name) and not is_snake_case(target.id):
-                error_msg = error_message(
-                    node.lineno,
-                    "S011",
-                    f"Variable '{target.id}' should be written in snake_case",
-                    self._path,
+    rules: frozenset = frozenset(RULE_CODES)
+    # Run S001, S002 and S006 with line_checks() rather than batched_line_checks()
+    per_line: bool = False
+    # Limits per file, None for none. See analyze_file_safe().
+    max_size: int | None = DEFAULT_MAX_FILE_SIZE
+    timeout: float | None = DEFAULT_FILE_TIMEOUT
+    max_depth: int | None = DEFAULT_MAX_DEPTH
+    # Reuse the findings of the top-level statements of a file that didn't
+    # change since its last analysis, see analyze_incrementally()
+    incremental: bool = False
+
+
+class ResourceLimitExceeded(Exception):
+    """A file is too big, too slow or too deeply nested to analyze in full."""
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise ResourceLimitExceeded in the block once seconds have passed.
+
+    Works with SIGALRM, so only in the main thread on Unix. Anywhere else,
+    or with seconds None, the block runs as long as it takes.
+    """
+    if (
+        not seconds
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise ResourceLimitExceeded(f"took longer than {seconds:g} s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def select_rules(select=None, ignore=None) -> frozenset:
+    """Rule codes matching the comma separated prefixes in select, minus ignore.
+
+    "S00" selects S001-S009, for instance. No select means all rules.
+    """
+
+    def matching(prefixes):
+        codes = set()
+        for prefix in prefixes.split(","):
+            prefix = prefix.strip().upper()
+            matches = {code for code in RULE_CODES if code.startswith(prefix)}
+            if not matches:
+                raise ValueError(f"no rule code starts with {prefix!r}")
+            codes |= matches
+        return codes
+
+    rules = matching(select) if select else set(RULE_CODES)
+    if ignore:
+        rules -= matching(ignore)
+    return frozenset(rules)
+
+
+class Profile:
+    """Wall time and call counts per phase and per rule, and time per file.
+
+    Nothing is measured unless a Profile is passed down, so a run without
+    --profile only pays for a few `is None` checks per file.
+    """
+
+    def __init__(self):
+        # name -> [seconds, calls]
+        self.phases: dict[str, list] = {}
+        self.rules: dict[str, list] = {}
+        # (seconds, path)
+        self.files: list[tuple[float, str]] = []
+
+    @staticmethod
+    def _add(table, key, seconds, calls=1):
+        entry = table.setdefault(key, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(self.phases, name, time.perf_counter() - start)
+
+    def add_phase_time(self, name, seconds, calls=1):
+        self._add(self.phases, name, seconds, calls)
+
+    def add_rule_time(self, error_code, seconds, calls=1):
+        self._add(self.rules, error_code, seconds, calls)
+
+    def timed(self, error_code, check):
+        """check, with the time spent in it added to error_code's total."""
+
+        def timed_check(*args):
+            start = time.perf_counter()
+            try:
+                return check(*args)
+            finally:
+                self._add(self.rules, error_code, time.perf_counter() - start)
+
+        return timed_check
+
+    def merge(self, other: "Profile"):
+        for table, other_table in (
+            (self.phases, other.phases),
+            (self.rules, other.rules),
+        ):
+            for key, (seconds, calls) in other_table.items():
+                self._add(table, key, seconds, calls)
+        self.files.extend(other.files)
+
+    def to_json(self, slowest=10) -> dict:
+        def table(entries):
+            return {
+                key: {"seconds": round(seconds, 6), "calls": calls}
+                for key, (seconds, calls) in sorted(entries.items())
+            }
+
+        return {
+            "phases": table(self.phases),
+            "rules": table(self.rules),
+            "slowest_files": [
+                {"path": path, "seconds": round(seconds, 6)}
+                for seconds, path in heapq.nlargest(slowest, self.files)
+            ],
+        }
+
+    def format(self, slowest=10) -> str:
+        report = self.to_json(slowest)
+        lines = []
+        for title in ("phases", "rules"):
+            lines.append(f"{title:<16}{'seconds':>12}{'calls':>10}")
+            for key, entry in report[title].items():
+                lines.append(
+                    f"  {key:<14}{entry['seconds']:>12.4f}{entry['calls']:>10}"
                 )
-                self._error_messages.append((node.lineno, error_msg))
-        self.generic_visit(node)
+        lines.append("slowest files")
+        for entry in report["slowest_files"]:
+            lines.append(f"  {entry['seconds']:>10.4f}  {entry['path']}")
+        return "\n".join(lines)
+
+
+class FileResult(NamedTuple):
+    """What analyzing one file or source string came to."""
+
+    path: str
+    diagnostics: list[Diagnostic]
+    # Why it couldn't be analyzed, e.g. a syntax error, or why only in part
+    failure: str | None = None
+    profile: Profile | None = None
+
 
-    def get_error_messages(self) -> list[tuple[int, str]]:
-        return self._error_messages
+def profile_phase(profile, name):
+    return nullcontext() if profile is None else profile.phase(name)
+
+
+def maybe_timed(profile, error_code, check):
+    return check if profile is None else profile.timed(error_code, check)
 
 
 def error_message(line_num, error_code, description, path: "path to a .py file"):
     return f"{path}: Line {line_num}: {error_code} {description}"
 
 
-def line_over_79_characters(line, line_number, path):
+def describe(diagnostic: Diagnostic) -> str:
+    return MESSAGES[diagnostic.code].format(*diagnostic.args)
+
+
+def format_diagnostic(path, diagnostic: Diagnostic) -> str:
+    return error_message(diagnostic.line, diagnostic.code, describe(diagnostic), path)
+
+
+def line_over_79_characters(line, line_number):
     if len(line) > 79:
-        print(
-            error_message(
-                line_number, "S001", "Line length over 79 characters", path=path
-            )
-        )
+        return Diagnostic(line_number, 79, "S001")
 
 
-def indentation_not_multiple_of_4(line, line_number, path):
+def indentation_not_multiple_of_4(line, line_number):
     indentation = len(line) - len(line.lstrip(" "))
     if indentation % 4 != 0:
-        print(
-            error_message(
-                line_number, "S002", "Indentation is not a multiple of four", path=path
-            )
-        )
+        return Diagnostic(line_number, 0, "S002")
 
 
-def unnecessary_semicolon(line, line_number, path):
-    statement = line.split("#")[0].rstrip()
-    if statement and statement[-1] == ";":
-        print(
-            error_message(
-                line_number,
-                "S003",
-                "Unnecessary semicolon after a statement",
-                path=path,
-            )
-        )
+def more_than_two_blank_lines(line, line_number, blank_count):
+    if len(line) == 0:
+        return blank_count + 1, None
+    if blank_count > 2:
+        return 0, Diagnostic(line_number, 0, "S006")
+    return 0, None
+
+
+LINE_RULE_CODES = frozenset({"S001", "S002", "S006"})
+
 
+def line_checks(source, rules=RULE_CODES, profile=None) -> list[Diagnostic]:
+    """S001, S002 and S006 one physical line at a time."""
+    return check_lines(io.StringIO(source), rules, profile)
 
-def less_than_2_spaces(line, line_number, path):
-    if "#" in line:
-        statement = line.split("#")[0]
-        if statement and len(statement) - len(statement.rstrip(" ")) < 2:
-            print(
-                error_message(
-                    line_number,
-                    "S004",
-                    "Less than two spaces before inline comment",
-                    path=path,
+
+def check_lines(lines, rules=RULE_CODES, profile=None) -> list[Diagnostic]:
+    """line_checks() of lines from any iterable, e.g. a file being read."""
+    errors = []
+    if not LINE_RULE_CODES.intersection(rules):
+        return errors
+
+    long_line = maybe_timed(profile, "S001", line_over_79_characters)
+    indentation = maybe_timed(profile, "S002", indentation_not_multiple_of_4)
+    blank_lines = maybe_timed(profile, "S006", more_than_two_blank_lines)
+    blank_count = 0
+    # Only the findings are kept, a file with millions of lines has few of them
+    for n, line in enumerate(lines, 1):
+        line = line.rstrip()
+
+        if "S001" in rules and (error := long_line(line, n)):
+            errors.append(error)
+        if "S002" in rules and (error := indentation(line, n)):
+            errors.append(error)
+        blank_count, blank_error = blank_lines(line, n, blank_count)
+        if "S006" in rules and blank_error:
+            errors.append(blank_error)
+    return errors
+
+
+# Whole-buffer equivalents of the per-line checks above, run on the source with
+# a newline prepended. Patterns start with a literal newline, which lets re jump
+# from line to line with a plain search instead of trying every position, and
+# every match ends on the reported line. What counts is the rstrip()ed line.
+BATCHED_LINE_RULES = (
+    (
+        "S001",
+        79,
+        # A non-whitespace character after the 79th column
+        re.compile(r"\n[^\n]{79}[^\n]*?\S"),
+    ),
+    (
+        "S002",
+        0,
+        # Leading spaces not a multiple of four, on a line that isn't blank
+        re.compile(r"\n(?: {4})*+ {1,3}+(?=[^\n]*?\S)"),
+    ),
+    (
+        "S006",
+        0,
+        # Three or more blank lines, the match ends where the code line starts
+        re.compile(r"\n(?:[^\S\n]*+\n){3,}+(?=[^\n]*?\S)"),
+    ),
+)
+
+
+def batched_line_checks(source, rules=RULE_CODES, profile=None) -> list[Diagnostic]:
+    """Same findings as line_checks(), from one regex scan of the buffer per rule."""
+    errors = []
+    if not LINE_RULE_CODES.intersection(rules):
+        return errors
+
+    buffer = "\n" + source
+    for error_code, col, pattern in BATCHED_LINE_RULES:
+        if error_code not in rules:
+            continue
+        start = time.perf_counter() if profile is not None else 0
+        # Thanks to the extra newline, the number of newlines before a match's
+        # end is the number of its line.
+        line_number, position = 0, 0
+        for match in pattern.finditer(buffer):
+            line_number += buffer.count("\n", position, match.end())
+            position = match.end()
+            errors.append(Diagnostic(line_number, col, error_code))
+        if profile is not None:
+            profile.add_rule_time(error_code, time.perf_counter() - start)
+    return errors
+
+
+TOKEN_RULE_CODES = frozenset({"S003", "S004", "S005", "S007", "S008", "S009"})
+
+
+def token_checks(source, rules=RULE_CODES, profile=None) -> list[Diagnostic]:
+    """Checks that need to tell code from comments and strings, in one tokenize pass."""
+    return check_tokens(io.StringIO(source).readline, rules, profile)
+
+
+def check_tokens(readline, rules=RULE_CODES, profile=None) -> list[Diagnostic]:
+    """token_checks() of the lines readline() returns, e.g. a file's."""
+    errors = []
+    if not TOKEN_RULE_CODES.intersection(rules):
+        # The file isn't even tokenized
+        return errors
+
+    def enabled(checks):
+        return [
+            maybe_timed(profile, error_code, check)
+            for error_code, check in checks
+            if error_code in rules
+        ]
+
+    comment_checks = enabled(COMMENT_CHECKS)
+    statement_checks = enabled(STATEMENT_CHECKS)
+    definition_checks = enabled(DEFINITION_CHECKS)
+    last_token = keyword = None
+    for token in tokenize.generate_tokens(readline):
+        if token.type == tokenize.COMMENT:
+            errors.extend(filter(None, (check(token) for check in comment_checks)))
+            continue
+
+        if token.type == tokenize.NEWLINE:
+            found = (check(last_token) for check in statement_checks)
+            errors.extend(filter(None, found))
+        elif keyword is not None and token.type == tokenize.NAME:
+            found = (check(keyword, token) for check in definition_checks)
+            errors.extend(filter(None, found))
+        is_keyword = token.type == tokenize.NAME and token.string in ("def", "class")
+        keyword = token if is_keyword else None
+        last_token = token
+    return errors
+
+
+def unnecessary_semicolon(last_token):
+    """last_token is the last token of a statement, comments not included."""
+    if last_token is not None and last_token.exact_type == tokenize.SEMI:
+        return Diagnostic(*last_token.start, "S003")
+
+
+def less_than_2_spaces(comment):
+    line_number, column = comment.start
+    statement = comment.line[:column]
+    if statement.strip() and len(statement) - len(statement.rstrip(" ")) < 2:
+        return Diagnostic(line_number, column, "S004")
+
+
+def todo_found(comment):
+    if "todo" in comment.string.lower():
+        return Diagnostic(*comment.start, "S005")
+
+
+# Definition checks get a 'def' or 'class' keyword token and the name token
+# right after it.
+
+
+def too_many_spaces_after_construction_name(keyword, name):
+    if name.start[0] != keyword.start[0]:
+        # Line continuation between the keyword and the name
+        return None
+    if name.start[1] - keyword.end[1] > 1:
+        return Diagnostic(*keyword.start, "S007", (keyword.string,))
+
+
+def class_name_not_in_camel_case(keyword, name):
+    # Not checking the parent. Let's say it should be reported at definition.
+    if keyword.string == "class" and re.match("[a-z0-9_]+", name.string):
+        return Diagnostic(*name.start, "S008", (name.string,))
+
+
+def is_snake_case(name) -> bool:
+    return not re.match("[A-Z]+", name)
+
+
+def function_name_not_in_snake_case(keyword, name):
+    if keyword.string == "def" and not is_snake_case(name.string):
+        return Diagnostic(*name.start, "S009", (name.string,))
+
+
+# (error code, check) of the checks token_checks() runs on every comment, on
+# the last token of every statement and on every definition
+COMMENT_CHECKS = (("S004", less_than_2_spaces), ("S005", todo_found))
+STATEMENT_CHECKS = (("S003", unnecessary_semicolon),)
+DEFINITION_CHECKS = (
+    ("S007", too_many_spaces_after_construction_name),
+    ("S008", class_name_not_in_camel_case),
+    ("S009", function_name_not_in_snake_case),
+)
+
+
+# (error code, node types, check) for every rule that works on the syntax tree
+AST_RULES = []
+
+
+def ast_rule(error_code, *node_types):
+    """Register a check that is called with every node of one of node_types.
+
+    The check yields Diagnostics. All registered checks share one walk of
+    the tree, see RuleEngine.
+    """
+
+    def register(check):
+        AST_RULES.append((error_code, node_types, check))
+        return check
+
+    return register
+
+
+class RuleEngine(ast.NodeVisitor):
+    """Walks the tree once, handing each node to the rules registered for its type.
+
+    With max_depth, raises ResourceLimitExceeded at nodes nested deeper.
+    """
+
+    def __init__(self, rules=AST_RULES, max_depth=None):
+        self._checks: dict[type, list] = {}
+        for _, node_types, check in rules:
+            for node_type in node_types:
+                self._checks.setdefault(node_type, []).append(check)
+        self._errors: list[Diagnostic] = []
+        self._max_depth = max_depth
+        # Statements are never inside expressions, so when all the rules are
+        # about statements the expressions needn't be walked
+        if all(issubclass(node_type, ast.stmt) for node_type in self._checks):
+            self._children = statement_children
+        else:
+            self._children = ast.iter_child_nodes
+
+    def visit(self, node):
+        # Nodes in the order NodeVisitor visits them, but kept on a list rather
+        # than the call stack, which a long `elif` or `1 + 1 + ...` chain fills
+        checks = self._checks
+        stack = [(node, 1)]
+        while stack:
+            node, depth = stack.pop()
+            if self._max_depth and depth > self._max_depth:
+                raise ResourceLimitExceeded(
+                    f"nested deeper than {self._max_depth} levels"
                 )
+            for check in checks.get(type(node), ()):
+                self._errors.extend(check(node))
+            children = list(self._children(node))
+            stack.extend((child, depth + 1) for child in reversed(children))
+
+    def get_errors(self) -> list[Diagnostic]:
+        return self._errors
+
+
+def statement_children(node):
+    """The statements right inside node, and the except and case clauses."""
+    for field in ("body", "handlers", "orelse", "finalbody", "cases"):
+        value = getattr(node, field, None)
+        if isinstance(value, list):
+            yield from value
+
+
+@ast_rule("S010", ast.FunctionDef)
+def argument_name_not_in_snake_case(node):
+    for arg in node.args.args:
+        if not is_snake_case(arg.arg):
+            yield Diagnostic(node.lineno, arg.col_offset, "S010", (arg.arg,))
+
+
+@ast_rule("S011", ast.Assign)
+def variable_name_not_in_snake_case(node):
+    for target in node.targets:
+        if isinstance(target, ast.Name) and not is_snake_case(target.id):
+            yield Diagnostic(node.lineno, target.col_offset, "S011", (target.id,))
+
+
+@ast_rule("S012", ast.FunctionDef)
+def mutable_default_argument(node):
+    for arg in node.args.args:
+        # Check if the default value is a mutable literal type
+        arg_value = None
+        arg_end = arg.end_col_offset
+        for default in node.args.defaults:
+            # Terrible hack, works only if there are no spaces
+            # around the assignment operator
+            if default.col_offset == arg_end + 1:
+                arg_value = default
+
+        if isinstance(arg_value, MUTABLE_LITERAL_NODES):
+            yield Diagnostic(
+                node.lineno,
+                arg_value.col_offset,
+                "S012",
+                (arg.arg, str(ast.literal_eval(arg_value))),
             )
 
 
-def todo_found(line, line_number, path):
-    if "#" in line:
-        comment = line.split("#")[1]
-        if "todo" in comment.lower():
-            print(error_message(line_number, "S005", "TODO found", path=path))
+# The line ends ast numbers lines by
+NEWLINE = re.compile(r"\r\n?|\n")
 
 
-def more_than_two_blank_lines(line, line_number, blank_count, path):
-    if len(line) == 0:
-        blank_count += 1
-    else:
-        if blank_count > 2:
-            print(
-                error_message(
-                    line_number,
-                    "S006",
-                    "More than two blank lines preceding a code line",
-                    path=path,
+def syntax_tree_checks(
+    source, rules=RULE_CODES, profile=None, filename="<unknown>", max_depth=None
+) -> list[Diagnostic]:
+    ast_rules = [rule for rule in AST_RULES if rule[0] in rules]
+    if not ast_rules:
+        # The file isn't even parsed
+        return []
+    if profile is not None:
+        ast_rules = [
+            # Checks are generators, the time is spent while they're consumed
+            (error_code, node_types, profile.timed(error_code, consume(check)))
+            for error_code, node_types, check in ast_rules
+        ]
+    engine = RuleEngine(ast_rules, max_depth)
+    with profile_phase(profile, "parse"):
+        try:
+            tree = ast.parse(source, filename)
+        except RecursionError:
+            raise ResourceLimitExceeded("nested too deeply to parse") from None
+    with profile_phase(profile, "ast checks"):
+        try:
+            engine.visit(tree)
+        except RecursionError:
+            raise ResourceLimitExceeded("nested too deeply to check") from None
+    errors = engine.get_errors()
+    if errors and not source.isascii():
+        # ast counts columns in UTF-8 bytes, the reports in characters
+        lines = NEWLINE.split(source)
+        errors = [
+            error._replace(col=character_column(lines[error.line - 1], error.col))
+            for error in errors
+        ]
+    return errors
+
+
+def character_column(line, byte_col) -> int:
+    """The character offset in line of ast's byte offset byte_col."""
+    return len(line.encode()[:byte_col].decode(errors="ignore"))
+
+
+def consume(check):
+    return lambda node: list(check(node))
+
+
+def diagnostics_from_json(errors) -> list[Diagnostic]:
+    return [
+        Diagnostic(line, col, code, tuple(args)) for line, col, code, args in errors
+    ]
+
+
+class ResultCache:
+    """Findings stored on disk under the hash of the analyzed file's content.
+
+    Entries are written to a temporary file and renamed into place, so
+    parallel runs sharing a cache directory never see a half written entry.
+    A hit bumps the entry's mtime, which is what evict() uses to find the
+    least recently used entries once the cache outgrows max_size. Entries
+    of a run with other rules, or with per_line set, are told apart.
+    """
+
+    def __init__(
+        self, directory, max_size=DEFAULT_CACHE_SIZE, rules=RULE_CODES, per_line=False
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        # per_line is there to cross-check the line checks, which a hit of the
+        # other engine's findings wouldn't do
+        engine = "per-line" if per_line else "batched"
+        self._salt = f"{ANALYZER_VERSION}:{','.join(sorted(rules))}:{engine}:".encode()
+
+    def key(self, content: bytes) -> str:
+        # Updated twice rather than concatenated, content may be a large mmap
+        digest = hashlib.sha256(self._salt)
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key) -> list[Diagnostic] | None:
+        entry = self._load(key)
+        return None if entry is None else diagnostics_from_json(entry)
+
+    def put(self, key, errors):
+        self._store(key, errors)
+
+    def get_blocks(self, key) -> dict[str, list[Diagnostic]] | None:
+        """The {digest: findings} stored by put_blocks(), see check_blocks()."""
+        entry = self._load(key)
+        if entry is None:
+            return None
+        return {digest: diagnostics_from_json(errors) for digest, errors in entry}
+
+    def put_blocks(self, key, blocks):
+        self._store(key, list(blocks.items()))
+
+    def _load(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as entry:
+                value = json.load(entry)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def _store(self, key, value):
+        entry_path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+        except OSError:
+            # A cache that can't be written to only costs speed
+            return
+        try:
+            with os.fdopen(fd, "w") as entry:
+                json.dump(value, entry)
+            os.replace(temp_path, entry_path)
+        except OSError:
+            os.remove(temp_path)
+
+    def evict(self):
+        """Remove the least recently used entries while over max_size.
+
+        The cache is only walked in full when a sample of it says it may be
+        over, so a run that added little doesn't pay for stat()ing it all.
+        """
+        sample = [os.path.join(self.directory, name) for name in CACHE_SAMPLE_DIRS]
+        sample_size = sum(size for _, size, _ in self._entries(sample))
+        # With some slack, the sample is only an estimate
+        if sample_size * 256 / len(sample) < self.max_size * 0.8:
+            return
+
+        entries = list(self._entries([self.directory]))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total_size -= size
+
+    @staticmethod
+    def _entries(directories):
+        """Yield (mtime, size, path) of the files under directories."""
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    entry_path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(entry_path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, entry_path
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Symbol(NamedTuple):
+    """A name a module defines, see module_symbols()."""
+
+    kind: str  # One of SYMBOL_KINDS
+    # Dotted for modules and for what is defined in a class, e.g. Class.method
+    name: str
+    line: int
+    col: int
+    # What an import refers to, e.g. os.path.join for `from os.path import join`
+    target: str = ""
+
+
+class SymbolIndex:
+    """The modules, classes, functions, variables and imports of a project.
+
+    Stored as compact JSON in path. update() parses again only the files
+    whose mtime or size changed since the last run, and lookup() finds a
+    name without going through all of them.
+    """
+
+    def __init__(self, path, root=None):
+        self.path = path
+        # Absolute path of the project directory, the files are relative to it
+        self.root = root
+        # {relative POSIX path: (mtime_ns, size, [Symbol])}
+        self.files = {}
+        self._by_name = None
+        self._changed = False
+
+    @classmethod
+    def load(cls, path):
+        """The index stored in path, empty if there is none of this version."""
+        try:
+            with open(path, "r") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return cls(path)
+        if not isinstance(stored, dict) or stored.get("version") != INDEX_VERSION:
+            return cls(path)
+        index = cls(path, stored["root"])
+        index.files = {
+            relative: (mtime, size, [Symbol(*symbol) for symbol in symbols])
+            for relative, (mtime, size, symbols) in stored["files"].items()
+        }
+        return index
+
+    def update(self, directory, paths, parse=None) -> int:
+        """Index paths, the files of directory, and forget any others.
+
+        parse(files) returns file_symbols() of each (path, relative path) in
+        files, in order, say from worker processes. By default the files are
+        parsed here one by one. Returns how many files had to be parsed.
+        """
+        root = os.path.abspath(directory)
+        if root != self.root:
+            self.root, self.files = root, {}
+        files = {}
+        stale = []
+        for path in paths:
+            if is_archive(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            relative = relative_posix_path(path, directory)
+            entry = self.files.get(relative)
+            if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                stale.append((path, relative, stat.st_mtime_ns, stat.st_size))
+            else:
+                files[relative] = entry
+        parse = parse or partial(map, file_symbols_entry)
+        parsed = parse([(path, relative) for path, relative, _, _ in stale])
+        for (_, relative, mtime, size), symbols in zip(stale, parsed):
+            files[relative] = mtime, size, symbols
+        if stale or files.keys() != self.files.keys():
+            self.files = files
+            self._by_name = None
+            self._changed = True
+        return len(stale)
+
+    def lookup(self, name) -> list[tuple[str, Symbol]]:
+        """(relative path, symbol) of the symbols called name.
+
+        name is a full name like Class.method or package.module, or the
+        part after the last dot, like method.
+        """
+        if self._by_name is None:
+            self._by_name = {}
+            for relative, symbol in self.symbols():
+                self._by_name.setdefault(symbol.name, []).append((relative, symbol))
+                short_name = symbol.name.rpartition(".")[2]
+                if short_name != symbol.name:
+                    self._by_name.setdefault(short_name, []).append((relative, symbol))
+        return self._by_name.get(name, [])
+
+    def symbols(self):
+        """Yield (relative path, symbol) of every symbol, by path and line."""
+        for relative in sorted(self.files):
+            for symbol in self.files[relative][2]:
+                yield relative, symbol
+
+    def save(self):
+        """Write the index to its path if it changed, the same way the cache does."""
+        if not self._changed:
+            return
+        stored = {
+            "version": INDEX_VERSION,
+            "root": self.root,
+            "files": {
+                relative: [
+                    mtime,
+                    size,
+                    [symbol if symbol.target else symbol[:4] for symbol in symbols],
+                ]
+                for relative, (mtime, size, symbols) in self.files.items()
+            },
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(stored, file, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        except OSError:
+            os.remove(temp_path)
+            raise
+        self._changed = False
+
+
+def file_symbols(path, relative) -> list[Symbol]:
+    """The Symbols of the file at path, the module itself first.
+
+    A file that can't be read or parsed only gets its module symbol.
+    """
+    symbols = [module_symbol(relative)]
+    try:
+        with open(path, "rb") as file:
+            tree = ast.parse(decode(file.read()), path)
+    except (OSError, SyntaxError, ValueError, RecursionError):
+        return symbols
+    symbols.extend(module_symbols(tree.body))
+    return symbols
+
+
+def file_symbols_entry(entry) -> list[Symbol]:
+    """file_symbols() of a (path, relative path) entry, for analyze_paths()."""
+    return file_symbols(*entry)
+
+
+def symbols_crash_result(entry) -> list[Symbol]:
+    return [module_symbol(entry[1])]
+
+
+def module_symbol(relative) -> Symbol:
+    module = os.path.splitext(relative)[0].split("/")
+    if module[-1] == "__init__" and len(module) > 1:
+        module.pop()
+    return Symbol("module", ".".join(module), 1, 0)
+
+
+def module_symbols(body, prefix=""):
+    """Yield the Symbols the statements of a module or class body define.
+
+    Statements nested in if, try, with and loops count, so do those of
+    classes, prefixed with the class name. Functions' bodies don't.
+    """
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            yield Symbol("function", prefix + node.name, node.lineno, node.col_offset)
+        elif isinstance(node, ast.ClassDef):
+            yield Symbol("class", prefix + node.name, node.lineno, node.col_offset)
+            yield from module_symbols(node.body, f"{prefix}{node.name}.")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name in target_names(target):
+                    yield Symbol(
+                        "variable", prefix + name.id, name.lineno, name.col_offset
+                    )
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                name = alias.asname or alias.name.partition(".")[0]
+                yield Symbol(
+                    "import", prefix + name, node.lineno, node.col_offset, alias.name
                 )
-            )
-        blank_count = 0
-    return blank_count
-
-
-def construction_checks(line, line_number, path):
-    # noinspection RegExpRepeatedSpace
-    match = re.search(
-        r"""(def|class)  # Construction name
-        (\ +)  # Spaces
-        (\w+)  # Class name
-        # Optional parent class:
-        (?:
-            \(
-            (\w+)  # Parent class name
-            \)
-        )?
-        (?:\(.*\))?  # Optional arg list for functions
-        :  # Match definitions ending in semicolon only""",
-        line,
-        re.VERBOSE,
-    )
-    if match:
-        construction_name, spaces, object_name, parent = match.groups()
-
-        too_many_spaces_after_construction_name(
-            line_number, path, construction_name, spaces
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            separator = "" if module.endswith(".") else "."
+            for alias in node.names:
+                yield Symbol(
+                    "import",
+                    prefix + (alias.asname or alias.name),
+                    node.lineno,
+                    node.col_offset,
+                    module + separator + alias.name,
+                )
+        else:
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                for child in getattr(node, field, ()):
+                    if isinstance(child, ast.ExceptHandler):
+                        yield from module_symbols(child.body, prefix)
+                    elif isinstance(child, ast.stmt):
+                        yield from module_symbols([child], prefix)
+
+
+def target_names(target):
+    """Yield the Names an assignment target binds, as in `a, (b, *c) = ...`.
+
+    Assigning to an attribute or an item, like `os.environ["X"] = ...`,
+    defines nothing.
+    """
+    if isinstance(target, ast.Name):
+        yield target
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            yield from target_names(element)
+    elif isinstance(target, ast.Starred):
+        yield from target_names(target.value)
+
+
+class DiscoveryOptions(NamedTuple):
+    """Which files under a directory get analyzed."""
+
+    extensions: tuple = DEFAULT_EXTENSIONS
+    # Globs matched against names and against paths relative to the directory
+    exclude: tuple = DEFAULT_EXCLUDE
+    use_gitignore: bool = True
+
+
+class Shard(NamedTuple):
+    """Which part of the files one of several hosts analyzes, see select()."""
+
+    # 1 to count
+    index: int
+    count: int
+    # "hash" or "size"
+    by: str = "hash"
+
+    @classmethod
+    def parse(cls, text, by="hash"):
+        """Shard from "K/N", raises ValueError if it's not a valid one."""
+        index, _, count = text.partition("/")
+        shard = cls(int(index), int(count), by)
+        if not 1 <= shard.index <= shard.count:
+            raise ValueError(f"shard {text} isn't one of 1/{count} to {count}/{count}")
+        return shard
+
+    def select(self, paths, names) -> list:
+        """The paths that belong to this shard, in the order of paths.
+
+        "hash" puts each file in a shard by a hash of its name in names,
+        its path relative to the directory it was found in, so every host
+        agrees whatever the checkout is called. "size" deals the files out
+        biggest first to the shard with the fewest bytes so far, which
+        evens out the work.
+        """
+        if self.by == "hash":
+            return [
+                path
+                for path in paths
+                if zlib.crc32(names[path].encode()) % self.count == self.index - 1
+            ]
+
+        sizes = {}
+        for path in paths:
+            try:
+                sizes[path] = os.stat(path).st_size
+            except OSError:
+                sizes[path] = 0
+        totals = [(0, shard) for shard in range(self.count)]
+        mine = set()
+        for path in sorted(paths, key=lambda path: (-sizes[path], path)):
+            total, shard = heapq.heappop(totals)
+            if shard == self.index - 1:
+                mine.add(path)
+            heapq.heappush(totals, (total + sizes[path], shard))
+        return [path for path in paths if path in mine]
+
+
+def relative_posix_path(path, directory):
+    return pathlib.PurePath(os.path.relpath(path, directory)).as_posix()
+
+
+def gitignore_pattern(pattern):
+    """Translate one .gitignore glob to a regex matching relative POSIX paths."""
+    regex = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            regex.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            regex.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "[" and "]" in pattern[index + 2 :]:
+            end = pattern.index("]", index + 2)
+            members = pattern[index + 1 : end]
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            regex.append(f"[{members}]")
+            index = end
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            regex.append(re.escape(pattern[index]))
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return "".join(regex)
+
+
+class GitIgnore:
+    """The rules of one .gitignore file, relative to the directory it's in."""
+
+    def __init__(self, lines):
+        # (compiled pattern, negated, directories only, anchored)
+        self._rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated or line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # A slash anywhere but at the end ties the pattern to this directory
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if line:
+                pattern = re.compile(gitignore_pattern(line) + r"\Z")
+                self._rules.append((pattern, negated, dir_only, anchored))
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            with open(os.path.join(directory, ".gitignore"), "r") as file:
+                return cls(file)
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def match(self, relative_path, is_dir):
+        """True or False if a rule decides about the path, None if none does."""
+        name = relative_path.rpartition("/")[2]
+        decision = None
+        for pattern, negated, dir_only, anchored in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if pattern.match(relative_path if anchored else name):
+                decision = not negated
+        return decision
+
+
+def discover_files(
+    directory, discovery=DiscoveryOptions(), skip_dirs=(), listings=None
+):
+    """Yield the paths of files to analyze under directory.
+
+    Excluded and ignored directories are pruned before they are entered.
+    Symlinked directories are followed, but each directory is entered once,
+    so symlink loops end. skip_dirs are never entered either.
+
+    Given a dict as listings, the walk stores what it read of each directory
+    there and, the next time, only reads again the directories whose mtime
+    or .gitignore changed, as watch() does on every poll.
+    """
+    visited = set()
+    for skip_dir in skip_dirs:
+        try:
+            stat = os.stat(skip_dir)
+        except OSError:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+    listed = set()
+
+    def is_excluded(name, relative_path):
+        return any(
+            fnmatch.fnmatchcase(name, glob) or fnmatch.fnmatchcase(relative_path, glob)
+            for glob in discovery.exclude
+        )
+
+    def is_ignored(gitignores, relative_path, is_dir):
+        # Deeper .gitignore files override the ones above them
+        ignored = False
+        for base, gitignore in gitignores:
+            if relative_path.startswith(base):
+                decision = gitignore.match(relative_path[len(base) :], is_dir)
+                if decision is not None:
+                    ignored = decision
+        return ignored
+
+    def gitignore_stat(path):
+        try:
+            stat = os.stat(os.path.join(path, ".gitignore"))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def list_directory(path, stat):
+        """The GitIgnore of path, or None, and its [(name, path, is_dir, is_file)]."""
+        listing = listings.get(path) if listings is not None else None
+        if listing is not None:
+            mtime, listed_at, ignore_stat, gitignore, entries = listing
+            if stat.st_mtime_ns == mtime and mtime < listed_at - LISTING_MTIME_SLACK:
+                if not discovery.use_gitignore or gitignore_stat(path) == ignore_stat:
+                    listed.add(path)
+                    return gitignore, entries
+        listed_at = time.time_ns()
+        ignore_stat = gitignore = None
+        if discovery.use_gitignore:
+            ignore_stat = gitignore_stat(path)
+            if ignore_stat is not None:
+                gitignore = GitIgnore.load(path)
+        try:
+            with os.scandir(path) as scanned:
+                # Sorted, so it's always the same path that reaches a directory
+                # linked from several places
+                scanned = sorted(scanned, key=lambda entry: entry.name)
+        except OSError:
+            return None, None
+        entries = []
+        for entry in scanned:
+            try:
+                is_dir = entry.is_dir()
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                continue
+            entries.append((entry.name, entry.path, is_dir, is_file))
+        if listings is not None:
+            listing = stat.st_mtime_ns, listed_at, ignore_stat, gitignore, entries
+            listings[path] = listing
+            listed.add(path)
+        return gitignore, entries
+
+    def walk(path, relative_dir, gitignores):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        identity = (stat.st_dev, stat.st_ino)
+        if identity in visited:
+            return
+        visited.add(identity)
+
+        gitignore, entries = list_directory(path, stat)
+        if entries is None:
+            return
+        if gitignore is not None:
+            gitignores = gitignores + [(relative_dir, gitignore)]
+
+        for name, entry_path, is_dir, is_file in entries:
+            relative_path = relative_dir + name
+            if is_excluded(name, relative_path):
+                continue
+            if gitignores and is_ignored(gitignores, relative_path, is_dir):
+                continue
+            if is_dir:
+                yield from walk(entry_path, relative_path + "/", gitignores)
+            elif is_file and name.endswith(discovery.extensions):
+                yield entry_path
+
+    yield from walk(directory, "", [])
+    if listings is not None:
+        # Forget the directories that are gone or no longer reached
+        for path in listings.keys() - listed:
+            del listings[path]
+
+
+HUNK_HEADER = re.compile(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+class ChangedLines(NamedTuple):
+    """Lines of a file added or changed since the base revision.
+
+    deleted_after holds N for every place lines were removed between line N
+    and N + 1 without adding any. All the lines of an untracked file count as
+    added, without being listed.
+    """
+
+    added: frozenset = frozenset()
+    deleted_after: frozenset = frozenset()
+    untracked: bool = False
+
+
+def git_changes(path, base) -> dict[str, ChangedLines]:
+    """{file path: ChangedLines} of the files under path git sees changed since base.
+
+    The paths are spelled the way discover_files(path) spells them. Like a
+    pull request, compares with where HEAD forked from base (their merge
+    base), so commits added to base since don't count. Compares the working
+    tree, so uncommitted changes count too, and so do the files git doesn't
+    track yet but doesn't ignore either. Raises ValueError when git fails.
+    """
+    if os.path.isdir(path):
+        directory, prefix, pathspec = path, path, "."
+    else:
+        prefix = os.path.dirname(path)
+        directory, pathspec = prefix or ".", os.path.basename(path)
+    fork_point = run_git(directory, "merge-base", base, "HEAD").decode().strip()
+    diff = run_git(
+        directory,
+        "-c",
+        "core.quotePath=false",
+        "diff",
+        "--no-color",
+        "--no-ext-diff",
+        "--unified=0",
+        "--diff-filter=d",
+        "--relative",
+        fork_point,
+        "--",
+        pathspec,
+    )
+
+    changes = {}
+    added = deleted_after = None
+    for line in diff.decode(errors="surrogateescape").splitlines():
+        if line.startswith("+++ "):
+            # git ends names with spaces in them with a tab
+            name = unquote_git_path(line[4:].removesuffix("\t"))
+            if name == "/dev/null":
+                added = deleted_after = None
+                continue
+            added, deleted_after = set(), set()
+            file_path = os.path.join(prefix, *name[2:].split("/"))
+            changes[file_path] = added, deleted_after
+        elif line.startswith("@@") and added is not None:
+            match = HUNK_HEADER.match(line)
+            start, count = int(match[1]), int(match[2] or 1)
+            if count:
+                added.update(range(start, start + count))
+            else:
+                deleted_after.add(start)
+    changes = {
+        file_path: ChangedLines(frozenset(added), frozenset(deleted_after))
+        for file_path, (added, deleted_after) in changes.items()
+    }
+
+    untracked = run_git(
+        directory, "ls-files", "--others", "--exclude-standard", "-z", "--", pathspec
+    )
+    for name in untracked.decode(errors="surrogateescape").split("\0"):
+        if name:
+            file_path = os.path.join(prefix, *name.split("/"))
+            changes[file_path] = ChangedLines(untracked=True)
+    return changes
+
+
+def run_git(directory, *args) -> bytes:
+    """The output of a git command run in directory, ValueError if it fails."""
+    try:
+        process = subprocess.run(
+            ["git", "-C", directory, *args], capture_output=True, check=True
         )
-        if construction_name == "class":
-            # Not checking the parent. Let's say it should be reported at definition.
-            class_name_not_in_camel_case(line_number, path, object_name)
-        elif construction_name == "def":
-            function_name_not_in_snake_case(line_number, path, object_name)
+    except FileNotFoundError:
+        raise ValueError("--diff needs git on the PATH") from None
+    except subprocess.CalledProcessError as exc:
+        raise ValueError(exc.stderr.decode(errors="replace").strip()) from None
+    return process.stdout
+
+
+def unquote_git_path(name):
+    """Undo the C-style quoting git applies to names with odd characters."""
+    if not name.startswith('"'):
+        return name
+    escaped = name[1:-1].encode(errors="surrogateescape").decode("unicode_escape")
+    return escaped.encode("latin-1").decode(errors="surrogateescape")
+
+
+def only_changed_lines(results, changes):
+    """Keep the findings of analyze_file_safe() results that are on changed lines."""
+    for path, errors, failure, profile in results:
+        changed = changes.get(path, ChangedLines())
+        lines = read_lines(path) if any(e.code == "S006" for e in errors) else []
+        errors = [error for error in errors if is_changed(error, changed, lines)]
+        yield path, errors, failure, profile
+
+
+def is_changed(diagnostic: Diagnostic, changed: ChangedLines, lines) -> bool:
+    """Whether the diagnostic is about lines in changed.
+
+    S006 is about the blank lines above a line, so it counts as changed when
+    any of those changed, or lines were deleted among them, even if the line
+    it's reported on didn't.
+    """
+    if changed.untracked:
+        return True
+    if diagnostic.code != "S006":
+        return diagnostic.line in changed.added
+    first = diagnostic.line
+    while first > 1 and first - 2 < len(lines) and not lines[first - 2].strip():
+        first -= 1
+    blank_and_reported = range(first, diagnostic.line + 1)
+    return any(line in changed.added for line in blank_and_reported) or any(
+        line in changed.deleted_after for line in range(first - 1, diagnostic.line)
+    )
+
+
+def read_lines(path) -> list[str]:
+    try:
+        with open_source(path) as file:
+            return file.read().splitlines()
+    except OSError:
+        return []
 
 
-def too_many_spaces_after_construction_name(
-    line_number, path, construction_name, spaces
+def analyze_path(
+    path,
+    reporter,
+    options=AnalysisOptions(),
+    jobs=None,
+    cache=None,
+    discovery=DiscoveryOptions(),
+    profile=None,
+    pool=None,
+    changes=None,
+    shard=None,
+    index=None,
 ):
-    if len(spaces) > 1:
-        print(
-            error_message(
-                line_number,
-                "S007",
-                f"Too many spaces after '{construction_name}'",
-                path=path,
+    """Analyze a file or a directory, see analyze_batch()."""
+    return analyze_batch(
+        [path],
+        reporter,
+        options,
+        jobs,
+        cache,
+        discovery,
+        profile,
+        pool,
+        changes,
+        shard,
+        index,
+    )
+
+
+def analyze_directory(
+    directory,
+    reporter,
+    options=AnalysisOptions(),
+    jobs=None,
+    cache=None,
+    discovery=DiscoveryOptions(),
+    profile=None,
+    pool=None,
+    changes=None,
+    shard=None,
+    index=None,
+):
+    """Analyze every file discovery finds under directory, see analyze_batch()."""
+    return analyze_batch(
+        [directory],
+        reporter,
+        options,
+        jobs,
+        cache,
+        discovery,
+        profile,
+        pool,
+        changes,
+        shard,
+        index,
+    )
+
+
+def analyze_batch(
+    paths,
+    reporter,
+    options=AnalysisOptions(),
+    jobs=None,
+    cache=None,
+    discovery=DiscoveryOptions(),
+    profile=None,
+    pool=None,
+    changes=None,
+    shard=None,
+    index=None,
+    stdin=None,
+    max_errors=None,
+):
+    """Analyze files and every file discovery finds under directories.
+
+    Everything given is analyzed as one batch, in a WorkerPool of jobs
+    processes, or in pool when one is given, so the daemon can keep its
+    workers between runs. With changes from git_changes(), only changed
+    files are analyzed and only findings on changed lines reported. With a
+    Shard, only the files in it are analyzed.
+
+    Results are reported sorted by path, whatever the order of paths, the
+    same order merging the partial files of a sharded run gives. Files with
+    the same content are analyzed once, and the findings reported for each
+    of them. A SymbolIndex given as index is brought up to date
+    with the files of paths[0], which must be the only path. stdin is
+    (name, content) of a buffer analyzed where "-" is in paths.
+
+    Once max_errors findings and failures are reported, the files still
+    being analyzed are abandoned. Returns how many of them were reported.
+    """
+    if pool is None and jobs != 1:
+        # Shared by the index and the analysis, it's only started when needed
+        with WorkerPool(jobs) as pool:
+            return analyze_batch(
+                paths,
+                reporter,
+                options,
+                jobs,
+                cache,
+                discovery,
+                profile,
+                pool,
+                changes,
+                shard,
+                index,
+                stdin,
+                max_errors,
             )
+
+    # Cache entries are valid Python, don't analyze them
+    skip_dirs = [cache.directory] if cache is not None else []
+    names = expand_paths(paths, discovery, skip_dirs)
+    # "-" goes where the name its result is reported under sorts
+    files = sorted(names, key=lambda path: stdin[0] if path == "-" else path)
+    if index is not None:
+        # The files new to the index are parsed in the workers too
+        parse = partial(
+            analyze_paths,
+            analyze=file_symbols_entry,
+            jobs=jobs,
+            pool=pool,
+            crashed=symbols_crash_result,
         )
+        with profile_phase(profile, "index"):
+            index.update(paths[0], files, parse)
+    if changes is not None:
+        files = [path for path in files if path in changes]
+    if shard is not None:
+        files = shard.select(files, names)
+
+    with profile_phase(profile, "deduplicate"):
+        originals = identical_files([path for path in files if path != "-"])
+    unique_paths = [path for path in files if path not in originals]
+
+    analyze = partial(
+        analyze_entry,
+        options=options,
+        cache=cache,
+        profiling=profile is not None,
+        extensions=discovery.extensions,
+    )
+    analyzed = analyze_paths(
+        [path for path in unique_paths if path != "-"],
+        analyze,
+        jobs,
+        pool,
+        crash_results,
+        partial(read_ahead, options=options),
+    )
+    results = analyzed
+    if "-" in names:
+        name, content = stdin
+        result = analyze_file_safe(name, options, cache, profile is not None, content)
+        # In its place among the others
+        results = chain(islice(results, unique_paths.index("-")), [[result]], results)
+    results = chain.from_iterable(copy_results(results, files, originals))
+    if changes is not None:
+        results = only_changed_lines(results, changes)
+    try:
+        return report_results(results, reporter, profile, max_errors)
+    finally:
+        # Stops whatever report_results() left unfinished
+        analyzed.close()
 
 
-def class_name_not_in_camel_case(line_number, path, class_name):
-    if re.match("[a-z0-9_]+", class_name):
-        print(
-            error_message(
-                line_number,
-                "S008",
-                f"Class name '{class_name}' should be written in CamelCase",
-                path=path,
+def expand_paths(paths, discovery=DiscoveryOptions(), skip_dirs=()) -> dict[str, str]:
+    """{path: name} of the files to analyze for paths, in the order given.
+
+    Directories stand for the files discover_files() finds in them, sorted,
+    named by their path relative to the directory. Other paths are named by
+    their file name. A file given twice is listed once.
+    """
+    names = {}
+    for path in paths:
+        if os.path.isdir(path):
+            # Sorting the paths up front keeps the report ordered by path, line
+            # and code no matter in which order the workers finish.
+            for file_path in sorted(discover_files(path, discovery, skip_dirs)):
+                names.setdefault(file_path, relative_posix_path(file_path, path))
+        else:
+            names.setdefault(path, os.path.basename(path))
+    return names
+
+
+def identical_files(paths) -> dict[str, str]:
+    """{path: the first of paths with the same content} for every duplicate.
+
+    Hard links are told apart by their inode. Other files are only compared
+    when some other file has the same size: by their first HEAD_SIZE bytes,
+    then, for those that start the same, by the hash of the whole file. The
+    reading is done on I/O threads.
+    """
+    originals = {}
+    by_inode = {}
+    by_size = {}
+    for path in paths:
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        original = by_inode.setdefault((info.st_dev, info.st_ino), path)
+        if original != path:
+            originals[path] = original
+        else:
+            by_size.setdefault(info.st_size, []).append(path)
+
+    candidates = [(size, group) for size, group in by_size.items() if len(group) > 1]
+    with ThreadPoolExecutor(READ_AHEAD_THREADS) as readers:
+        head = partial(digest_file, limit=HEAD_SIZE)
+        candidates = split_by_digest(candidates, head, readers)
+        # The head of a small file is all of it
+        same = [(size, group) for size, group in candidates if size <= HEAD_SIZE]
+        larger = [(size, group) for size, group in candidates if size > HEAD_SIZE]
+        same += split_by_digest(larger, digest_file, readers)
+    for _, group in same:
+        for path in group[1:]:
+            originals[path] = group[0]
+    # A hard link to a duplicate points straight at the first copy
+    return {
+        path: originals.get(original, original) for path, original in originals.items()
+    }
+
+
+def split_by_digest(candidates, digest, readers):
+    """The (size, paths) candidates split by digest(path) run on readers.
+
+    Only the groups of two or more paths are kept.
+    """
+    paths = [path for _, group in candidates for path in group]
+    digests = dict(zip(paths, readers.map(digest, paths)))
+    split = []
+    for size, group in candidates:
+        by_digest = {}
+        for path in group:
+            if digests[path] is not None:
+                by_digest.setdefault(digests[path], []).append(path)
+        split.extend((size, same) for same in by_digest.values() if len(same) > 1)
+    return split
+
+
+def digest_file(path, limit=None):
+    """The hash of the first limit bytes of the file, of all by default.
+
+    None if the file can't be read.
+    """
+    try:
+        with open(path, "rb") as file:
+            if limit is None:
+                return hashlib.file_digest(file, "sha256").digest()
+            return hashlib.sha256(file.read(limit)).digest()
+    except OSError:
+        return None
+
+
+def copy_results(results, paths, originals):
+    """Yield analyze_entry() results for paths, given those not in originals.
+
+    Duplicates get their original's findings. Originals always come first,
+    so only the results of those that have duplicates are kept around.
+    """
+    results = iter(results)
+    have_copies = set(originals.values())
+    kept = {}
+    for path in paths:
+        if path in originals:
+            original = originals[path]
+            yield [
+                # Archive members are reported as path!member
+                result._replace(path=path + result.path[len(original) :], profile=None)
+                for result in kept[original]
+            ]
+            continue
+        result = next(results)
+        if path in have_copies:
+            kept[path] = result
+        yield result
+
+
+def analyze_paths(paths, analyze, jobs=None, pool=None, crashed=None, read=None):
+    """Yield analyze() results in the order of paths, in worker processes if any.
+
+    crashed(path) is the result when analyzing path crashed a worker, by
+    default a FileResult saying so. When the paths are analyzed in this
+    process and read is given, read(path) of the next paths runs on I/O
+    threads while a path is analyzed. It returns keyword arguments, such as
+    content, for analyze(path).
+    """
+    if len(paths) < 2 or (pool is None and jobs == 1):
+        if read is None:
+            yield from map(analyze, paths)
+        else:
+            yield from analyze_reading_ahead(paths, analyze, read)
+        return
+    with nullcontext(pool) if pool is not None else WorkerPool(jobs) as workers:
+        yield from analyze_in_pool(paths, workers, analyze, crashed)
+
+
+def analyze_reading_ahead(paths, analyze, read):
+    """analyze() each path, with the next READ_AHEAD being read meanwhile."""
+    with ThreadPoolExecutor(READ_AHEAD_THREADS) as readers:
+        reads = deque()
+        try:
+            for path in paths:
+                reads.append((path, readers.submit(read, path)))
+                if len(reads) > READ_AHEAD:
+                    path, read_kwargs = reads.popleft()
+                    yield analyze(path, **read_kwargs.result())
+            while reads:
+                path, read_kwargs = reads.popleft()
+                yield analyze(path, **read_kwargs.result())
+        except GeneratorExit:
+            readers.shutdown(cancel_futures=True)
+            raise
+
+
+def watch(
+    path,
+    reporter,
+    options=AnalysisOptions(),
+    jobs=None,
+    cache=None,
+    discovery=DiscoveryOptions(),
+    debounce=DEFAULT_DEBOUNCE,
+):
+    """Report everything under path, then only what changes, until interrupted.
+
+    Files are polled: one whose mtime or size changed is read and, if its
+    content hash differs too, analyzed again. Once a change is seen, nothing
+    is analyzed until the tree stayed the same for debounce seconds, so a
+    branch switch is handled as one batch. reporter.report_changes() gets
+    the new and the resolved findings of every file in the batch.
+    """
+    skip_dirs = [cache.directory] if cache is not None else []
+    if os.path.isdir(path):
+        # Only the directories whose mtime changed are read again on each poll
+        list_files = partial(discover_files, path, discovery, skip_dirs, {})
+    else:
+        list_files = partial(iter, [path])
+    analyze = partial(
+        analyze_entry, options=options, cache=cache, extensions=discovery.extensions
+    )
+    findings = {}
+    hashes = {}
+
+    def remember(results):
+        for result in results:
+            if result.diagnostics or result.failure:
+                findings[result.path] = result.diagnostics, result.failure
+            yield result
+
+    with WorkerPool(jobs) as pool:
+        stats = file_stats(list_files())
+        results = analyze_paths(sorted(stats), analyze, jobs, pool, crash_results)
+        report_results(remember(chain.from_iterable(results)), reporter)
+        reporter.flush()
+        try:
+            while True:
+                time.sleep(WATCH_INTERVAL)
+                current = file_stats(list_files())
+                if current == stats:
+                    continue
+                while True:
+                    time.sleep(debounce)
+                    settled = file_stats(list_files())
+                    if settled == current:
+                        break
+                    current = settled
+
+                changed = []
+                for file_path, stat in current.items():
+                    if stat == stats.get(file_path):
+                        continue
+                    try:
+                        with open(file_path, "rb") as file:
+                            digest = hashlib.sha256(file.read()).digest()
+                    except OSError:
+                        digest = None
+                    if digest is None or digest != hashes.get(file_path):
+                        hashes[file_path] = digest
+                        changed.append(file_path)
+                removed = [file_path for file_path in stats if file_path not in current]
+                stats = current
+
+                results = analyze_paths(
+                    sorted(changed), analyze, jobs, pool, crash_results
+                )
+                results = {
+                    result.path: (result.diagnostics, result.failure)
+                    for result in chain.from_iterable(results)
+                }
+                for file_path in removed:
+                    hashes.pop(file_path, None)
+                for file_path in changed + removed:
+                    results.setdefault(file_path, ([], None))
+                    if is_archive(file_path):
+                        # Members that are gone resolve their findings too
+                        prefix = f"{file_path}!"
+                        for old_path in findings:
+                            if old_path.startswith(prefix):
+                                results.setdefault(old_path, ([], None))
+                for file_path in sorted(results):
+                    errors, failure = results[file_path]
+                    old_errors, old_failure = findings.pop(file_path, ([], None))
+                    if errors or failure:
+                        findings[file_path] = errors, failure
+                    reporter.report_changes(
+                        file_path,
+                        [error for error in errors if error not in old_errors],
+                        [error for error in old_errors if error not in errors],
+                    )
+                    if failure and failure != old_failure:
+                        reporter.failure(file_path, failure)
+                reporter.flush()
+        except KeyboardInterrupt:
+            pass
+
+
+def file_stats(paths) -> dict:
+    """{path: (mtime, size)} of the paths that can still be stat()ed."""
+    stats = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stats[path] = stat.st_mtime_ns, stat.st_size
+    return stats
+
+
+def report_results(results, reporter, profile=None, max_errors=None) -> int:
+    """Hand analyze_file_safe() results to the reporter, merging their profiles.
+
+    Returns how many findings and failures were reported. With max_errors,
+    stops taking results once that many of them together were reported.
+    """
+    reported = 0
+    for path, errors, failure, file_profile in results:
+        if max_errors is not None:
+            errors = errors[: max_errors - reported]
+            if reported + len(errors) >= max_errors:
+                failure = None
+        with profile_phase(profile, "report"):
+            reporter.report(path, errors)
+            if failure:
+                reporter.failure(path, failure)
+        if file_profile is not None:
+            profile.merge(file_profile)
+        reported += len(errors) + bool(failure)
+        if max_errors is not None and reported >= max_errors:
+            break
+    return reported
+
+
+class WorkerPool:
+    """A ProcessPoolExecutor that is started on first use and can be reused.
+
+    Tasks run in the working directory of the process that submitted them,
+    not the one the workers were started in, so relative paths keep working
+    when the daemon changes directory between requests.
+    """
+
+    def __init__(self, jobs=None):
+        self.jobs = jobs
+        self._executor = None
+
+    def submit(self, fn, *args):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.jobs)
+        return self._executor.submit(call_in_directory, os.getcwd(), fn, *args)
+
+    def reset(self):
+        """Stop the workers, the next submit() starts new ones."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def terminate(self):
+        """reset() without waiting for the tasks that are running."""
+        if self._executor is not None:
+            # ProcessPoolExecutor has no public way to stop a running task
+            for process in list(self._executor._processes.values()):
+                process.terminate()
+        self.reset()
+
+    close = reset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def call_in_directory(directory, fn, *args):
+    if os.getcwd() != directory:
+        os.chdir(directory)
+    return fn(*args)
+
+
+def analyze_in_pool(paths, pool, analyze, crashed=None):
+    """Yield analyze() results in the order of paths.
+
+    A worker dying outright (not just raising) breaks the whole pool. The file
+    that was waited on is then retried alone, so only the one that really
+    crashes gets reported, and the rest continue in a fresh pool. Closing
+    the generator cancels the files not done yet.
+    """
+    pending = paths
+    try:
+        while pending:
+            futures = [pool.submit(analyze, path) for path in pending]
+            for index, future in enumerate(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    break
+                yield result
+            else:
+                return
+            pool.reset()
+            yield analyze_in_isolation(pending[index], analyze, crashed)
+            pending = pending[index + 1 :]
+    except GeneratorExit:
+        # Closed before the end, by --max-errors say, the rest isn't wanted
+        pool.terminate()
+        raise
+
+
+def analyze_in_isolation(path, analyze, crashed=None):
+    with ProcessPoolExecutor(1) as executor:
+        try:
+            return executor.submit(analyze, path).result()
+        except BrokenProcessPool:
+            return (crashed or crash_result)(path)
+
+
+def crash_result(path):
+    return FileResult(path, [], "analysis crashed the worker process")
+
+
+def crash_results(path):
+    """crash_result() for analyze_entry(), which returns lists."""
+    return [crash_result(path)]
+
+
+def source_crash_result(source):
+    return crash_result(source[0])
+
+
+def analyze_source(
+    text, filename="<unknown>", options=AnalysisOptions()
+) -> list[Diagnostic]:
+    """Findings in the source code text, sorted by line and code.
+
+    Nothing is read from disk or printed. filename is only used in the
+    SyntaxError raised when text doesn't parse.
+    """
+    return check_source(text, options, filename=filename)
+
+
+def analyze_many(sources, options=AnalysisOptions(), jobs=None, pool=None):
+    """Yield a FileResult for each (name, text) in sources, in the same order.
+
+    Source that doesn't parse gets its failure set instead of raising. The
+    batch is spread over a WorkerPool of jobs processes, or over pool, to
+    keep the workers for the next batch. With jobs=1 everything runs in
+    this process.
+    """
+    sources = list(sources)
+    analyze = partial(analyze_source_safe, options=options)
+    return analyze_paths(sources, analyze, jobs, pool, source_crash_result)
+
+
+def analyze_source_safe(source, options=AnalysisOptions()):
+    name, text = source
+    try:
+        return FileResult(name, analyze_source(text, name, options))
+    except Exception as exc:
+        return FileResult(name, [], f"{type(exc).__name__}: {exc}")
+
+
+def analyze_entry(
+    path,
+    options=AnalysisOptions(),
+    cache=None,
+    profiling=False,
+    extensions=DEFAULT_EXTENSIONS,
+    content=None,
+    read_time=None,
+) -> list[FileResult]:
+    """[FileResult] of a file, or the FileResults of an archive's members.
+
+    content is that of the file, if it was read already, in read_time seconds.
+    """
+    if is_archive(path):
+        return analyze_archive(path, options, cache, profiling, extensions)
+    return [analyze_file_safe(path, options, cache, profiling, content, read_time)]
+
+
+def is_archive(path) -> bool:
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def analyze_archive(
+    path,
+    options=AnalysisOptions(),
+    cache=None,
+    profiling=False,
+    extensions=DEFAULT_EXTENSIONS,
+) -> list[FileResult]:
+    """FileResults of the members of a zip or tar archive, sorted by path.
+
+    Members whose names end with one of the extensions that aren't archive
+    suffixes themselves are read into memory one at a time and reported as
+    `path!member`. A member over max_size isn't read into memory but goes to
+    analyze_large_member(). When the archive can't be read, the failure is
+    reported for path itself.
+    """
+    extensions = tuple(suffix for suffix in extensions if not is_archive(suffix))
+    results = []
+    try:
+        members = archive_members(path, extensions or DEFAULT_EXTENSIONS)
+        for name, size, stream in members:
+            member_path = f"{path}!{name}"
+            if options.max_size and size > options.max_size:
+                result = analyze_large_member(member_path, stream, options, profiling)
+            else:
+                content = stream.read()
+                result = analyze_file_safe(
+                    member_path, options, cache, profiling, content
+                )
+            results.append(result)
+    except Exception as exc:
+        results.append(FileResult(path, [], f"{type(exc).__name__}: {exc}"))
+    results.sort(key=lambda result: result.path)
+    return results
+
+
+def archive_members(path, extensions):
+    """Yield (name, size, stream) of the files in an archive named with extensions.
+
+    The size is the uncompressed one from the archive's index, and stream is
+    the member's file object, only valid until the next member is yielded.
+    """
+    if path.lower().endswith((".whl", ".zip")):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith(extensions):
+                    with archive.open(info) as stream:
+                        yield info.filename, info.file_size, stream
+    else:
+        # As a stream: a compressed tar can't be seeked in without decompressing
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(extensions):
+                    with archive.extractfile(member) as stream:
+                        yield member.name, member.size, stream
+
+
+def analyze_large_member(path, stream, options=AnalysisOptions(), profiling=False):
+    """The FileResult of an archive member over max_size, read from stream.
+
+    The member is copied to a temporary file a chunk at a time, for the
+    degraded_checks() to read line by line like any other file that big.
+    """
+    profile = Profile() if profiling else None
+    start = time.perf_counter()
+    failure = f"degraded to line and token checks, larger than {options.max_size} bytes"
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            copy = os.path.join(directory, "member")
+            with open(copy, "wb") as file:
+                shutil.copyfileobj(stream, file)
+            errors = degraded_checks(copy, options)
+    except Exception as exc:
+        errors, failure = [], f"{type(exc).__name__}: {exc}"
+    if profile is not None:
+        profile.files.append((time.perf_counter() - start, path))
+    return FileResult(path, errors, failure, profile)
+
+
+def analyze_file_safe(
+    path,
+    options=AnalysisOptions(),
+    cache=None,
+    profiling=False,
+    content=None,
+    read_time=None,
+):
+    """The FileResult of one file, failures included rather than raised.
+
+    If content is given, it's analyzed instead of what is at path. A file
+    over one of the limits in options gets only the degraded_checks(), and
+    a failure saying so. read_time is how long reading content took, when it
+    was read ahead, and is profiled as the file's read phase.
+    """
+    profile = Profile() if profiling else None
+    start = time.perf_counter()
+    if profile is not None and read_time is not None:
+        profile.add_phase_time("read", read_time)
+        start -= read_time
+    try:
+        errors, failure = analyze_file(path, options, cache, profile, content), None
+    except ResourceLimitExceeded as exc:
+        failure = f"degraded to line and token checks, {exc}"
+        try:
+            errors = degraded_checks(path, options, content)
+        except Exception as exc:
+            errors, failure = [], f"{type(exc).__name__}: {exc}"
+    except Exception as exc:
+        errors, failure = [], f"{type(exc).__name__}: {exc}"
+    if profile is not None:
+        profile.files.append((time.perf_counter() - start, path))
+    return FileResult(path, errors, failure, profile)
+
+
+def analyze_file(
+    path, options=AnalysisOptions(), cache=None, profile=None, content=None
+) -> list[Diagnostic]:
+    if content is None:
+        with profile_phase(profile, "read"):
+            content = read_source(path, options)
+    else:
+        check_size(len(content), options)
+    if cache is None:
+        with time_limit(options.timeout):
+            return analyze_content(content, options, profile)
+
+    with profile_phase(profile, "cache"):
+        key = cache.key(content)
+        errors = cache.get(key)
+    if errors is None:
+        with time_limit(options.timeout):
+            if options.incremental and len(content) >= INCREMENTAL_MIN_SIZE:
+                errors = analyze_incrementally(path, content, options, cache, profile)
+            else:
+                errors = analyze_content(content, options, profile)
+        with profile_phase(profile, "cache"):
+            cache.put(key, errors)
+    return errors
+
+
+def read_source(path, options=AnalysisOptions()):
+    """The bytes of the file at path, as an mmap if the file is big.
+
+    Raises ResourceLimitExceeded rather than reading a file over max_size.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        check_size(size, options)
+        if size < MMAP_MIN_SIZE:
+            return file.read()
+        content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(content, "madvise"):
+        # Start reading it all in now rather than page by page as it's decoded
+        content.madvise(mmap.MADV_WILLNEED)
+    return content
+
+
+def read_ahead(path, options=AnalysisOptions()):
+    """read_source() for analyze_paths(), as analyze_entry() keyword arguments.
+
+    Those are the content and the time it took to read. Archives, files over
+    the limit and errors are left to the analysis, which reports them, and
+    get none.
+    """
+    if is_archive(path):
+        return {}
+    start = time.perf_counter()
+    try:
+        content = read_source(path, options)
+    except (OSError, ValueError, ResourceLimitExceeded):
+        return {}
+    return {"content": content, "read_time": time.perf_counter() - start}
+
+
+def check_size(size, options):
+    if options.max_size and size > options.max_size:
+        raise ResourceLimitExceeded(f"larger than {options.max_size} bytes")
+
+
+def degraded_checks(path, options=AnalysisOptions(), content=None):
+    """The checks that don't need the syntax tree, S001 to S009.
+
+    The file is read line by line rather than held in memory, once for the
+    line checks and once for the token checks. The token checks are left
+    out if the file doesn't tokenize.
+    """
+    if content is not None:
+        open_text = partial(io.StringIO, decode(content, errors="replace"))
+    else:
+        open_text = partial(open_source, path)
+    with open_text() as text:
+        errors = check_lines(text, options.rules)
+    try:
+        with open_text() as text:
+            errors.extend(check_tokens(text.readline, options.rules))
+    except (SyntaxError, tokenize.TokenError):
+        pass
+    return clean_errors(errors)
+
+
+def analyze_content(
+    content: bytes, options=AnalysisOptions(), profile=None
+) -> list[Diagnostic]:
+    return check_source(decode(content, profile), options, profile)
+
+
+def decode(content: bytes, profile=None, errors="strict") -> str:
+    """The text of Python source, decoded the way Python itself decodes it.
+
+    That's as the BOM or coding cookie says (PEP 263), UTF-8 otherwise, with
+    universal newlines. content can be any buffer, such as an mmap.
+    """
+    with profile_phase(profile, "decode"):
+        # The cookie is on one of the first two lines
+        second_newline = content.find(b"\n", content.find(b"\n") + 1)
+        head = content[: second_newline + 1] if second_newline != -1 else content
+        try:
+            encoding = tokenize.detect_encoding(io.BytesIO(head).readline)[0]
+        except SyntaxError:
+            if errors == "strict":
+                raise
+            encoding = "utf-8"
+        source = str(content, encoding, errors)
+        if "\r" in source:
+            source = source.replace("\r\n", "\n").replace("\r", "\n")
+        return source
+
+
+def open_source(path):
+    """The file at path opened as text the way decode() decodes it.
+
+    For reading line by line. Bytes that can't be decoded are replaced.
+    """
+    file = open(path, "rb")
+    try:
+        encoding = tokenize.detect_encoding(file.readline)[0]
+        file.seek(0)
+    except SyntaxError:
+        encoding = "utf-8"
+        file.seek(0)
+    except BaseException:
+        file.close()
+        raise
+    return io.TextIOWrapper(file, encoding, errors="replace")
+
+
+def analyze_incrementally(
+    path, content: bytes, options=AnalysisOptions(), cache=None, profile=None
+) -> list[Diagnostic]:
+    """analyze_content(), reusing findings from the last analysis of path.
+
+    The findings of each top-level block are kept in the cache under the
+    absolute path, and blocks whose text is the same as then aren't checked
+    again. The findings are the same as those of a full analysis.
+    """
+    source = decode(content, profile)
+    identity = f"blocks:{options.max_depth}:{os.path.abspath(path)}"
+    key = cache.key(identity.encode(errors="surrogateescape"))
+    with profile_phase(profile, "cache"):
+        known = cache.get_blocks(key) or {}
+    checked = check_blocks(source, options, profile, known)
+    if checked is None:
+        return check_source(source, options, profile)
+    errors, blocks = checked
+    with profile_phase(profile, "cache"):
+        cache.put_blocks(key, blocks)
+    return errors
+
+
+# Lines at column 0 that carry on the statement above them
+CONTINUED_STATEMENT = re.compile(r"(?:else|elif|except|finally)\b|[)\]}]")
+
+
+def top_level_blocks(source) -> list[tuple[int, str]]:
+    """(number of lines above it, text) of each top-level statement of source.
+
+    A block starts at a line at column 0 and takes the blank lines above it
+    along, so S006 sees the same blank lines in the block as in the file.
+    Where a statement starts is only guessed from the text, say a line in a
+    multi-line string may look like one; check_blocks() sorts that out.
+    """
+    lines = source.split("\n")
+    starts = [0]
+    in_string = False
+    for index, line in enumerate(lines):
+        previous = lines[index - 1] if index else ""
+        if (
+            index
+            and not in_string
+            and line[:1] not in ("", " ", "\t", "\f", "#")
+            and not previous.endswith("\\")
+            and not previous.startswith("@")
+            and not CONTINUED_STATEMENT.match(line)
+        ):
+            start = index
+            while start > starts[-1] and not lines[start - 1].strip():
+                start -= 1
+            if start > starts[-1]:
+                starts.append(start)
+        if (line.count('"""') + line.count("'''")) % 2:
+            in_string = not in_string
+
+    ends = starts[1:] + [len(lines)]
+    return [
+        (start, "\n".join(lines[start:end]) + ("\n" if end < len(lines) else ""))
+        for start, end in zip(starts, ends)
+    ]
+
+
+def check_blocks(
+    source, options=AnalysisOptions(), profile=None, known=None
+) -> tuple[list[Diagnostic], dict] | None:
+    """check_source() one top-level block at a time, skipping those in known.
+
+    known and the returned blocks are {digest of the text: findings} with
+    line numbers counted from the block's first line. A block that doesn't
+    parse on its own is joined with the next one, say it ends in the middle
+    of a string. Blocks that parse on their own tokenize and parse the same
+    in the file, so the findings are those of check_source(source). None if
+    the source can't be cut up like that.
+    """
+    if "barry_as_FLUFL" in source:
+        # This import changes what parses in the rest of the file
+        return None
+    known = known or {}
+    blocks = {}
+    errors = []
+    pending = top_level_blocks(source)
+    index = 0
+    while index < len(pending):
+        start, text = pending[index]
+        index += 1
+        for _ in range(MAX_BLOCK_MERGES):
+            digest = hashlib.sha256(text.encode(errors="surrogatepass")).hexdigest()
+            found = blocks.get(digest, known.get(digest))
+            if found is not None:
+                break
+            try:
+                found = check_source(text, options, profile)
+                break
+            except (SyntaxError, ValueError, tokenize.TokenError):
+                if index == len(pending):
+                    return None
+                text += pending[index][1]
+                index += 1
+        else:
+            return None
+        blocks[digest] = found
+        errors.extend(error._replace(line=error.line + start) for error in found)
+    return clean_errors(errors), blocks
+
+
+def check_source(
+    source, options=AnalysisOptions(), profile=None, filename="<unknown>"
+) -> list[Diagnostic]:
+    # Each family of checks is skipped as a whole when none of its rules is on
+    errors = syntax_tree_checks(
+        source, options.rules, profile, filename, options.max_depth
+    )
+    with profile_phase(profile, "token checks"):
+        errors.extend(token_checks(source, options.rules, profile))
+    with profile_phase(profile, "line checks"):
+        if options.per_line:
+            errors.extend(line_checks(source, options.rules, profile))
+        else:
+            errors.extend(batched_line_checks(source, options.rules, profile))
+    return clean_errors(errors)
+
+
+def clean_errors(errors) -> list[Diagnostic]:
+    """The errors sorted by line and code, without the Nones and repeats."""
+    # The same message twice for one line (say, `A = A = 1`) is printed once.
+    unique_errors = {}
+    for error in errors:
+        if error:
+            unique_errors.setdefault((error.line, error.code, error.args), error)
+    # Stable sort: errors with equal line and code keep the order they were found in
+    return sorted(unique_errors.values(), key=lambda error: (error.line, error.code))
+
+
+class TextReporter:
+    """Prints findings as `path: Line N: SXXX message`.
+
+    The text is collected and written in chunks of about buffer_size
+    characters rather than with one print() per finding. Call close() at
+    the end to write out the rest.
+    """
+
+    def __init__(self, stream=None, buffer_size=REPORT_BUFFER_SIZE):
+        self._stream = sys.stdout if stream is None else stream
+        self._buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+
+    def report(self, path, diagnostics):
+        if not diagnostics:
+            return
+        chunk = "".join([self.format(path, diagnostic) for diagnostic in diagnostics])
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        if self._size >= self._buffer_size:
+            self.flush()
+
+    def report_changes(self, path, new, resolved):
+        """Report what --watch found to appear and disappear in a file."""
+        changes = [(diagnostic, "new") for diagnostic in new]
+        changes.extend((diagnostic, "resolved") for diagnostic in resolved)
+        changes.sort(key=lambda change: (change[0].line, change[0].code))
+        for diagnostic, change in changes:
+            self._chunks.append(self.format_change(path, diagnostic, change))
+
+    @staticmethod
+    def format(path, diagnostic: Diagnostic) -> str:
+        return f"{format_diagnostic(path, diagnostic)}\n"
+
+    @staticmethod
+    def format_change(path, diagnostic: Diagnostic, change) -> str:
+        sign = "+" if change == "new" else "-"
+        return f"{sign} {format_diagnostic(path, diagnostic)}\n"
+
+    @staticmethod
+    def failure(path, reason):
+        print(f"{path}: {reason}", file=sys.stderr)
+
+    def flush(self):
+        self._stream.write("".join(self._chunks))
+        self._stream.flush()
+        self._chunks.clear()
+        self._size = 0
+
+    def close(self):
+        self.flush()
+
+
+class JsonLinesReporter(TextReporter):
+    """One JSON object per finding, written out as soon as a file is done.
+
+    Columns are 1-based, like in editors and SARIF.
+    """
+
+    def report(self, path, diagnostics):
+        super().report(path, diagnostics)
+        if diagnostics:
+            self.flush()
+
+    @staticmethod
+    def record(path, diagnostic: Diagnostic) -> dict:
+        return {
+            "path": path,
+            "line": diagnostic.line,
+            "column": diagnostic.col + 1,
+            "code": diagnostic.code,
+            "message": describe(diagnostic),
+        }
+
+    @classmethod
+    def format(cls, path, diagnostic: Diagnostic) -> str:
+        return f"{json.dumps(cls.record(path, diagnostic))}\n"
+
+    @classmethod
+    def format_change(cls, path, diagnostic: Diagnostic, change) -> str:
+        record = cls.record(path, diagnostic)
+        record["change"] = change
+        return f"{json.dumps(record)}\n"
+
+
+def path_uri(path) -> str:
+    """path as a URI reference: a file: URI if absolute, percent-encoded if not."""
+    if os.path.isabs(path):
+        return pathlib.Path(path).as_uri()
+    return urllib.parse.quote(pathlib.PurePath(path).as_posix())
+
+
+class SarifReporter:
+    """Collects the findings into one SARIF 2.1.0 log, written by close()."""
+
+    def __init__(self, stream=None):
+        self._stream = sys.stdout if stream is None else stream
+        self._rule_index = {code: index for index, code in enumerate(MESSAGES)}
+        self._results = []
+        self._notifications = []
+
+    @staticmethod
+    def _location(path, line=None, col=None):
+        location = {"artifactLocation": {"uri": path_uri(path)}}
+        if line is not None:
+            location["region"] = {"startLine": line, "startColumn": col + 1}
+        return {"physicalLocation": location}
+
+    def report(self, path, diagnostics):
+        for diagnostic in diagnostics:
+            self._results.append(
+                {
+                    "ruleId": diagnostic.code,
+                    "ruleIndex": self._rule_index[diagnostic.code],
+                    "level": "warning",
+                    "message": {"text": describe(diagnostic)},
+                    "locations": [
+                        self._location(path, diagnostic.line, diagnostic.col)
+                    ],
+                }
             )
+
+    def failure(self, path, reason):
+        self._notifications.append(
+            {
+                "level": "error",
+                "message": {"text": reason},
+                "locations": [self._location(path)],
+            }
         )
 
+    def close(self):
+        rules = [
+            {"id": code, "shortDescription": {"text": message.replace("{}", "...")}}
+            for code, message in MESSAGES.items()
+        ]
+        log = {
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {
+                        "driver": {
+                            "name": "code_analyzer",
+                            "version": ANALYZER_VERSION,
+                            "rules": rules,
+                        }
+                    },
+                    "invocations": [
+                        {
+                            "executionSuccessful": True,
+                            "toolExecutionNotifications": self._notifications,
+                        }
+                    ],
+                    "results": self._results,
+                }
+            ],
+        }
+        json.dump(log, self._stream, indent=2)
+        self._stream.write("\n")
+        self._stream.flush()
 
-def is_snake_case(name) -> bool:
-    return not re.match("[A-Z]+", name)
 
+class StatisticsReporter:
+    """Counts findings per rule, file and directory instead of printing them.
 
-def function_name_not_in_snake_case(line_number, path, function_name):
-    if not is_snake_case(function_name):
-        print(
-            error_message(
-                line_number,
-                "S009",
-                f"Function name '{function_name}' should be written in snake_case",
-                path=path,
-            )
+    close() writes the totals: a table, JSON, or with mode="count" only the
+    number of findings. Failures still go to stderr as they happen.
+    """
+
+    def __init__(self, stream=None, mode="table"):
+        self._stream = sys.stdout if stream is None else stream
+        self._mode = mode
+        self._files = 0
+        self._failures = 0
+        self._rules = Counter()
+        self._paths = Counter()
+        self._directories = Counter()
+
+    def report(self, path, diagnostics):
+        self._files += 1
+        if not diagnostics:
+            return
+        count = len(diagnostics)
+        self._paths[path] += count
+        self._directories[os.path.dirname(path)] += count
+        self._rules.update(diagnostic.code for diagnostic in diagnostics)
+
+    def failure(self, path, reason):
+        self._failures += 1
+        TextReporter.failure(path, reason)
+
+    def to_json(self) -> dict:
+        return {
+            "findings": self._rules.total(),
+            "files": self._files,
+            "files_with_findings": len(self._paths),
+            "failures": self._failures,
+            "rules": dict(sorted(self._rules.items())),
+            "directories": dict(sorted(self._directories.items())),
+            "paths": dict(sorted(self._paths.items())),
+        }
+
+    def format(self) -> str:
+        width = max(map(len, self._directories), default=0)
+        width = max(width, len("directory")) + 2
+        lines = [f"{'rule':<6}{'findings':>10}  message"]
+        for code, count in sorted(self._rules.items()):
+            message = MESSAGES[code].replace("{}", "...")
+            lines.append(f"{code:<6}{count:>10}  {message}")
+        lines.append(f"{'total':<6}{self._rules.total():>10}")
+        lines.append("")
+        lines.append(f"{'directory':<{width}}{'findings':>10}")
+        for directory, count in sorted(self._directories.items()):
+            lines.append(f"{directory or '.':<{width}}{count:>10}")
+        lines.append("")
+        lines.append(
+            f"{len(self._paths)} of {self._files} files with findings, "
+            f"{self._failures} failures"
         )
+        return "\n".join(lines)
 
+    def close(self):
+        if self._mode == "count":
+            self._stream.write(f"{self._rules.total()}\n")
+        elif self._mode == "json":
+            json.dump(self.to_json(), self._stream, indent=2)
+            self._stream.write("\n")
+        else:
+            self._stream.write(self.format() + "\n")
+        self._stream.flush()
 
-def syntax_tree_checks(tree, path) -> list[tuple[int, str]]:
-    default_arg_errors = mutable_arguments(tree, path)
-    return default_arg_errors
 
+class PartialReporter:
+    """Writes one shard's results for `code_analyzer.py merge` to combine.
 
-def mutable_arguments(source_code, path) -> list[tuple[int, str]]:
-    # Parse the source code into an AST
-    tree = ast.parse(source_code)
+    JSON Lines: a header with the analyzer version, the shard and the
+    rules, then `[path, [[line, col, code, args], ...], failure]` for each
+    file with findings or a failure. A file with both, say one analyzed only
+    in part, gets a record for each, read_partials() puts them together.
+    """
 
-    # Create an instance of the visitor
-    visitor = MutableArgumentVisitor(path)
+    def __init__(self, stream, shard: Shard, rules=RULE_CODES):
+        self._stream = stream
+        header = {
+            "version": ANALYZER_VERSION,
+            "shard": [shard.index, shard.count],
+            "rules": sorted(rules),
+        }
+        self._stream.write(json.dumps(header) + "\n")
 
-    # Traverse the AST
-    visitor.visit(tree)
+    def report(self, path, diagnostics):
+        if diagnostics:
+            self._write(path, diagnostics, None)
 
-    return visitor.get_error_messages()
+    def failure(self, path, reason):
+        self._write(path, [], reason)
 
+    def _write(self, path, diagnostics, failure):
+        record = [path, [list(diagnostic) for diagnostic in diagnostics], failure]
+        self._stream.write(json.dumps(record, separators=(",", ":")) + "\n")
 
-def analyze_directory(directory):
-    for root, _, files in os.walk(directory):
-        for name in files:
-            path = os.path.join(root, name)
+    def close(self):
+        self._stream.close()
 
-            analyze_file(path)
 
+def read_partials(paths) -> list[FileResult]:
+    """Results of all the partial files of one sharded run, sorted by path.
 
-def analyze_file(path):
-    with open(path, "r") as file:
-        tree = ast.parse(file.read())
-        # IMPORTANT - reset the read pointer:
-        file.seek(0)
-        errors_from_ast = {}
-        for line_num, error in syntax_tree_checks(tree, path):
-            if line_num not in errors_from_ast:
-                errors_from_ast[line_num] = [error]
-            elif error not in errors_from_ast[line_num]:
-                errors_from_ast[line_num].append(error)
-        # print(errors_from_ast)
-
-        blank_count = 0
-        for n, line in enumerate(file, 1):
-            line = line.rstrip()
-
-            line_over_79_characters(line, n, path=path)
-            indentation_not_multiple_of_4(line, n, path=path)
-            unnecessary_semicolon(line, n, path=path)
-            less_than_2_spaces(line, n, path=path)
-            todo_found(line, n, path=path)
-            blank_count = more_than_two_blank_lines(line, n, blank_count, path=path)
-            construction_checks(line, n, path=path)
-            if n in errors_from_ast:
-                for error in errors_from_ast[n]:
-                    print(error)
-
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("path", help="a valid path to a file or directory")
-    file_or_dir = parser.parse_args().path
-    # file_or_dir = input()  # No input prompt allowed lol
-
-    if os.path.isdir(file_or_dir):
-        analyze_directory(file_or_dir)
-    elif os.path.isfile(file_or_dir):
-        analyze_file(file_or_dir)
+    Raises ValueError unless the files are of this analyzer version, with
+    the same rules, and together cover every shard exactly once.
+    """
+    results = {}
+    headers = []
+    for path in paths:
+        with open(path, "r") as file:
+            header = json.loads(file.readline() or "null")
+            if not isinstance(header, dict) or header["version"] != ANALYZER_VERSION:
+                raise ValueError(f"{path}: not a partial file of this analyzer version")
+            headers.append(header)
+            for line in file:
+                file_path, diagnostics, failure = json.loads(line)
+                diagnostics = [
+                    Diagnostic(line, col, code, tuple(args))
+                    for line, col, code, args in diagnostics
+                ]
+                if file_path in results:
+                    # The findings and the failure of the same file
+                    known = results[file_path]
+                    diagnostics = known.diagnostics + diagnostics
+                    failure = failure or known.failure
+                results[file_path] = FileResult(file_path, diagnostics, failure)
+
+    if not headers:
+        raise ValueError("no partial files given")
+    counts = {header["shard"][1] for header in headers}
+    if len(counts) > 1:
+        raise ValueError("the partial files are from runs split in different ways")
+    if len({tuple(header["rules"]) for header in headers}) > 1:
+        raise ValueError("the partial files were made with different rules")
+    indexes = sorted(header["shard"][0] for header in headers)
+    expected = list(range(1, counts.pop() + 1))
+    if indexes != expected:
+        missing = sorted(set(expected) - set(indexes))
+        duplicate = sorted({index for index in indexes if indexes.count(index) > 1})
+        raise ValueError(f"shards missing: {missing}, given twice: {duplicate}")
+    return [results[path] for path in sorted(results)]
+
+
+def merge(argv) -> int:
+    """`code_analyzer.py merge PARTIAL...`: print the report of a sharded run."""
+    parser = argparse.ArgumentParser(
+        prog="code_analyzer.py merge",
+        description="Combine the --shard partial files into the report a single "
+        "run would have printed.",
+    )
+    parser.add_argument("partials", nargs="+", metavar="PARTIAL")
+    parser.add_argument("--format", choices=REPORTERS, default="text")
+    args = parser.parse_args(argv)
+    try:
+        results = read_partials(args.partials)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+    reporter = REPORTERS[args.format]()
+    try:
+        problems = report_results(results, reporter)
+    finally:
+        reporter.close()
+    return 1 if problems else 0
+
+
+def symbols(argv) -> int:
+    """`code_analyzer.py symbols INDEX [NAME...]`: query a symbol index."""
+    parser = argparse.ArgumentParser(
+        prog="code_analyzer.py symbols",
+        description="Print where the symbols of an --index file are defined, "
+        "as `path:line:col: kind name`, with paths relative to the project.",
+    )
+    parser.add_argument("index", metavar="INDEX")
+    parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="NAME",
+        help="names to look up, e.g. join, Class.method or package.module "
+        "(default: all)",
+    )
+    parser.add_argument(
+        "--kind",
+        choices=SYMBOL_KINDS,
+        action="append",
+        help="only symbols of this kind, can be given several times",
+    )
+    args = parser.parse_args(argv)
+    index = SymbolIndex.load(args.index)
+    if index.root is None:
+        parser.error(f"{args.index} isn't a symbol index of this analyzer version")
+    if args.names:
+        found = chain.from_iterable(index.lookup(name) for name in args.names)
+    else:
+        found = index.symbols()
+    for relative, symbol in found:
+        if args.kind and symbol.kind not in args.kind:
+            continue
+        target = f" -> {symbol.target}" if symbol.target else ""
+        location = f"{relative}:{symbol.line}:{symbol.col}"
+        print(f"{location}: {symbol.kind} {symbol.name}{target}")
+    return 0
+
+
+REPORTERS = {
+    "text": TextReporter,
+    "jsonl": JsonLinesReporter,
+    "sarif": SarifReporter,
+}
+
+
+def input_paths(args, files_from=None) -> list[str]:
+    """The paths main() analyzes.
+
+    Those in args, with @FILE standing for the paths listed in FILE, and
+    then those listed in the file files_from, or on stdin if it's "-".
+    """
+    paths = []
+    for arg in args:
+        if arg.startswith("@"):
+            with open(arg[1:], "rb") as file:
+                paths.extend(split_path_list(file.read()))
+        else:
+            paths.append(arg)
+    if files_from == "-":
+        paths.extend(split_path_list(sys.stdin.buffer.read()))
+    elif files_from is not None:
+        with open(files_from, "rb") as file:
+            paths.extend(split_path_list(file.read()))
+    return paths
+
+
+def split_path_list(content: bytes) -> list[str]:
+    """The paths in content, separated by NULs or, if there are none, lines."""
+    entries = content.split(b"\0") if b"\0" in content else content.splitlines()
+    return [os.fsdecode(entry) for entry in entries if entry]
+
+
+def default_socket_path():
+    """Where --serve listens and analyzer_client.py connects by default.
+
+    That's in a directory of its own, which serve() makes private.
+    """
+    # analyzer_client.py doesn't import this module, keep its copy in sync
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"code_analyzer-{os.getuid()}", "daemon.sock")
+
+
+def make_private_directory(path):
+    """Create the directory at path for its owner only, or check it's such.
+
+    Raises ValueError for a directory someone else could have put a socket
+    in, e.g. one created in /tmp by another user first.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise ValueError(f"{path}: not a directory of this user")
+    if info.st_mode & 0o077:
+        raise ValueError(f"{path}: other users have access to it")
+
+
+class DaemonStream(io.TextIOBase):
+    """Sends whatever is written to it to the client as `{name: text}` lines."""
+
+    def __init__(self, replies, name):
+        self._replies = replies
+        self._name = name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            send_reply(self._replies, {self._name: text})
+        return len(text)
+
+
+def send_reply(replies, message):
+    replies.write(json.dumps(message).encode() + b"\n")
+
+
+def serve(socket_path=None, jobs=None, idle_timeout=DEFAULT_IDLE_TIMEOUT) -> int:
+    """Answer analyzer_client.py until no request came for idle_timeout seconds.
+
+    The process stays warm between requests: modules imported, regular
+    expressions compiled, worker processes started. Requests are handled one
+    at a time, each in the working directory of its client.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        print("--serve needs Unix domain sockets", file=sys.stderr)
+        return 1
+    if socket_path is None:
+        socket_path = default_socket_path()
+        try:
+            make_private_directory(os.path.dirname(socket_path))
+        except (OSError, ValueError) as exc:
+            print(f"can't serve: {exc}", file=sys.stderr)
+            return 1
+    if os.path.lexists(socket_path):
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                # Left behind by a daemon that was killed
+                os.unlink(socket_path)
+            else:
+                print(f"{socket_path}: a daemon is already running", file=sys.stderr)
+                return 1
+
+    listener = socket.socket(socket.AF_UNIX)
+    # Only the owner may connect, the daemon reads whatever it's asked to
+    umask = os.umask(0o177)
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(umask)
+    listener.listen()
+    listener.settimeout(idle_timeout)
+    print(f"listening on {socket_path}", file=sys.stderr)
+    try:
+        with listener, WorkerPool(jobs) as pool:
+            while True:
+                try:
+                    connection, _ = listener.accept()
+                except TimeoutError:
+                    break
+                with connection:
+                    connection.settimeout(None)
+                    try:
+                        handle_request(connection, pool)
+                    except (OSError, ValueError, LookupError) as exc:
+                        print(f"request failed: {exc!r}", file=sys.stderr)
+    finally:
+        os.unlink(socket_path)
+    return 0
+
+
+def handle_request(connection, pool):
+    """Run the command line a client sent, streaming its output back.
+
+    A request is one JSON object: {"cwd": ..., "argv": [...]} and, when the
+    source comes from stdin, "stdin" with the base64 encoded bytes. Replies
+    are {"stdout": text}, {"stderr": text} and finally {"exit": status}.
+    """
+    with connection.makefile("rb") as requests, connection.makefile(
+        "wb", buffering=0
+    ) as replies:
+        line = requests.readline()
+        if not line:  # someone checking whether a daemon is running
+            return
+        request = json.loads(line)
+        directory = os.getcwd()
+        stdin = sys.stdin
+        try:
+            os.chdir(request["cwd"])
+            if "stdin" in request:
+                content = base64.b64decode(request["stdin"])
+                sys.stdin = io.TextIOWrapper(io.BytesIO(content))
+            with redirect_stdout(DaemonStream(replies, "stdout")), redirect_stderr(
+                DaemonStream(replies, "stderr")
+            ):
+                try:
+                    status = main(request["argv"], pool)
+                except SystemExit as exc:  # argparse errors and --help
+                    status = exc.code
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+            send_reply(replies, {"exit": status})
+        finally:
+            sys.stdin = stdin
+            os.chdir(directory)
+
+
+def main(argv=None, pool=None) -> int:
+    """Run the command line argv (default: sys.argv[1:]), return the exit status.
+
+    A daemon passes its WorkerPool as pool, to reuse the running workers.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["merge"]:
+        return merge(argv[1:])
+    if argv[:1] == ["symbols"]:
+        return symbols(argv[1:])
+    parser = argparse.ArgumentParser(
+        epilog="The exit status is 1 when anything was found or a file couldn't "
+        "be analyzed in full, 2 for invalid arguments and 0 otherwise."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        metavar="path",
+        help="files, archives or directories to analyze together, - to read the "
+        "source from stdin, @FILE for the paths listed in FILE",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="number of worker processes for directories (default: CPU count)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"where to keep results of unchanged files (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="maximum size of the cache directory in bytes",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't read or write the cache"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="empty the cache before the analysis",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="for files of 32 KiB or more, only check again the top-level "
+        "statements that changed since the file was last analyzed",
+    )
+    parser.add_argument(
+        "--per-line",
+        action="store_true",
+        help="run S001, S002 and S006 line by line instead of scanning whole files, "
+        "to cross-check the two",
+    )
+    parser.add_argument(
+        "--format",
+        choices=REPORTERS,
+        default="text",
+        help="text (default), jsonl: a JSON object per finding, streamed as files "
+        "are done, or sarif: one SARIF 2.1.0 document",
+    )
+    parser.add_argument(
+        "--select",
+        metavar="CODES",
+        help="comma separated rule codes or code prefixes to check, e.g. S001,S01 "
+        "(default: all)",
+    )
+    parser.add_argument(
+        "--ignore",
+        metavar="CODES",
+        help="comma separated rule codes or code prefixes not to check",
+    )
+    parser.add_argument(
+        "--extensions",
+        default=",".join(DEFAULT_EXTENSIONS),
+        help="comma separated file name endings of the files to analyze in "
+        "directories (default: %(default)s). Add e.g. .whl,.tar.gz to analyze the "
+        "files in archives too, which are always analyzed when given as path",
+    )
+    parser.add_argument(
+        "--exclude",
+        metavar="GLOB",
+        action="append",
+        default=[],
+        help="skip files and directories whose name or relative path matches GLOB, "
+        "can be given several times. "
+        f"Always skipped: {', '.join(DEFAULT_EXCLUDE)}",
+    )
+    parser.add_argument(
+        "--no-gitignore",
+        action="store_true",
+        help="analyze files even if a .gitignore file ignores them",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print time spent per phase, per rule and in the slowest files to stderr",
+    )
+    parser.add_argument(
+        "--profile-json",
+        metavar="PATH",
+        help="write the --profile report to PATH as JSON (implies --profile)",
+    )
+    parser.add_argument(
+        "--profile-slowest",
+        metavar="N",
+        type=int,
+        default=10,
+        help="number of slowest files in the profile (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="start a daemon that analyzer_client.py hands its runs to, which "
+        "saves the startup time of each run",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Unix socket of the daemon (default: daemon.sock in a private "
+        "code_analyzer-UID directory in $XDG_RUNTIME_DIR or the temporary "
+        "directory)",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="stop the daemon after this long without a request "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and report findings that appear (+) or get resolved (-) "
+        "as files change",
+    )
+    parser.add_argument(
+        "--debounce",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help="with --watch, wait until files stopped changing for this long "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--diff",
+        metavar="BASE",
+        help="analyze only the files changed since the current branch forked from "
+        "git revision BASE (e.g. origin/main) and report only findings on the "
+        "changed lines",
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="K/N",
+        help="analyze only the K-th of N parts of the files and write the results "
+        "to --partial, for `code_analyzer.py merge PARTIAL...` to combine",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=("hash", "size"),
+        default="hash",
+        help="split the files by a hash of their path (default) or so that "
+        "every part has about as many bytes",
+    )
+    parser.add_argument(
+        "--partial",
+        metavar="PATH",
+        help="where --shard writes its results (default: shard-K-of-N.jsonl)",
+    )
+    parser.add_argument(
+        "--max-file-size",
+        metavar="BYTES",
+        type=int,
+        default=DEFAULT_MAX_FILE_SIZE,
+        help="only run the line and token checks (S001 to S009) on bigger files, "
+        "reading them line by line (default: %(default)s, 0 for no limit)",
+    )
+    parser.add_argument(
+        "--file-timeout",
+        metavar="SECONDS",
+        type=float,
+        default=DEFAULT_FILE_TIMEOUT,
+        help="only run the line and token checks on files whose analysis takes "
+        "longer "
+        "(default: %(default)s, 0 for no limit)",
+    )
+    parser.add_argument(
+        "--max-depth",
+        metavar="N",
+        type=int,
+        default=DEFAULT_MAX_DEPTH or 0,
+        help="only run the line and token checks on files whose syntax tree is "
+        "deeper (default: 0, no limit)",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="PATH",
+        help="keep an index of the modules, classes, functions, variables and "
+        "imports of the directory in PATH, parsing only files changed since the "
+        "last run (query it with `code_analyzer.py symbols PATH`)",
+    )
+    parser.add_argument(
+        "--statistics",
+        action="store_true",
+        help="instead of the findings, print how many there are per rule and "
+        "directory (as JSON with per-file counts too with --format jsonl)",
+    )
+    parser.add_argument(
+        "--count",
+        action="store_true",
+        help="instead of the findings, print how many there are",
+    )
+    parser.add_argument(
+        "--files-from",
+        metavar="FILE",
+        help="also analyze the paths listed in FILE, - for stdin, one per line "
+        "or separated by NUL characters",
+    )
+    parser.add_argument(
+        "--stdin-filename",
+        metavar="NAME",
+        default="stdin",
+        help="the path to report the source read for - under (default: stdin)",
+    )
+    parser.add_argument(
+        "--max-errors",
+        metavar="N",
+        type=int,
+        help="stop once N findings or files that failed are reported, abandoning "
+        "the files still being analyzed",
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="stop at the first finding or failure, the same as --max-errors 1",
+    )
+    # Paths may come after options, as in `a.py --select S001 b.py`
+    args = parser.parse_intermixed_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs takes 1 or more")
+    if args.serve:
+        if pool is not None:
+            parser.error("--serve can't be sent to a daemon")
+        return serve(args.socket, args.jobs, args.idle_timeout)
+    if "-" in args.paths and args.files_from == "-":
+        parser.error("stdin can't hold both the source for - and --files-from")
+    try:
+        paths = input_paths(args.paths, args.files_from)
+    except OSError as exc:
+        parser.error(f"can't read the list of paths: {exc}")
+    # paths = [input()]  # No input prompt allowed lol
+    if not paths:
+        parser.error("the following arguments are required: path")
+    if args.watch and (pool is not None or args.format == "sarif"):
+        parser.error("--watch can't be sent to a daemon or used with --format sarif")
+    if args.watch and (len(paths) > 1 or "-" in paths):
+        parser.error("--watch takes a single path, not stdin")
+    max_errors = 1 if args.fail_fast else args.max_errors
+    if max_errors is not None and (max_errors < 1 or args.watch):
+        parser.error("--max-errors takes 1 or more, and doesn't work with --watch")
+
+    try:
+        rules = select_rules(args.select, args.ignore)
+    except ValueError as exc:
+        parser.error(str(exc))
+    options = AnalysisOptions(
+        rules=rules,
+        per_line=args.per_line,
+        # 0 turns a limit off
+        max_size=args.max_file_size or None,
+        timeout=args.file_timeout or None,
+        max_depth=args.max_depth or None,
+        incremental=args.incremental,
+    )
+    if args.incremental and args.no_cache:
+        parser.error("--incremental keeps what it reuses in the cache, drop --no-cache")
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(
+            args.cache_dir,
+            max_size=args.cache_size,
+            rules=rules,
+            per_line=args.per_line,
+        )
+        if args.clear_cache:
+            cache.clear()
+    elif args.clear_cache:
+        ResultCache(args.cache_dir).clear()
+
+    discovery = DiscoveryOptions(
+        extensions=tuple(args.extensions.split(",")),
+        exclude=DEFAULT_EXCLUDE + tuple(args.exclude),
+        use_gitignore=not args.no_gitignore,
+    )
+    changes = None
+    if args.diff is not None:
+        if args.watch or "-" in paths:
+            parser.error("--diff can't be used with --watch or stdin")
+        changes = {}
+        try:
+            for path in paths:
+                changes.update(git_changes(path, args.diff))
+        except ValueError as exc:
+            parser.error(str(exc))
+    shard = None
+    if args.shard is not None:
+        if args.watch or "-" in paths:
+            parser.error("--shard can't be used with --watch or stdin")
+        try:
+            shard = Shard.parse(args.shard, args.shard_by)
+        except ValueError as exc:
+            parser.error(f"--shard: {exc}")
+    index = None
+    if args.index is not None:
+        if args.watch or len(paths) > 1 or not os.path.isdir(paths[0]):
+            parser.error("--index needs a single directory, and no --watch")
+        index = SymbolIndex.load(args.index)
+    profile = Profile() if args.profile or args.profile_json else None
+    problems = 0
+    if args.statistics or args.count:
+        if shard is not None or args.watch:
+            parser.error("--statistics and --count don't work with --shard or --watch")
+        if args.count:
+            mode = "count"
+        else:
+            mode = "json" if args.format == "jsonl" else "table"
+        reporter = StatisticsReporter(mode=mode)
+    elif shard is not None:
+        partial = args.partial or f"shard-{shard.index}-of-{shard.count}.jsonl"
+        reporter = PartialReporter(open(partial, "w"), shard, rules)
+    else:
+        reporter = REPORTERS[args.format]()
+    try:
+        if args.watch and os.path.exists(paths[0]):
+            watch(
+                paths[0],
+                reporter,
+                options,
+                jobs=args.jobs,
+                cache=cache,
+                discovery=discovery,
+                debounce=args.debounce,
+            )
+        elif not args.watch:
+            stdin = None
+            if "-" in paths:
+                stdin = args.stdin_filename, sys.stdin.buffer.read()
+            problems = analyze_batch(
+                paths,
+                reporter,
+                options,
+                jobs=args.jobs,
+                cache=cache,
+                discovery=discovery,
+                profile=profile,
+                pool=pool,
+                changes=changes,
+                shard=shard,
+                index=index,
+                stdin=stdin,
+                max_errors=max_errors,
+            )
+    finally:
+        with profile_phase(profile, "report"):
+            reporter.close()
+
+    if profile is not None:
+        print(profile.format(args.profile_slowest), file=sys.stderr)
+        if args.profile_json:
+            with open(args.profile_json, "w") as file:
+                json.dump(profile.to_json(args.profile_slowest), file, indent=2)
+
+    if index is not None:
+        try:
+            index.save()
+        except OSError as exc:
+            print(f"couldn't write the symbol index: {exc}", file=sys.stderr)
+    if cache is not None:
+        cache.evict()
+    return 1 if problems else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
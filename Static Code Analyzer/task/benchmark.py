@@ -0,0 +1,320 @@
+"""Throughput benchmark for analyzer/code_analyzer.py.
+
+Generates reproducible synthetic corpora, analyzes each in a process of its
+own and reports files/s, lines/s, peak RSS and the time spent in each phase.
+With --baseline, exits with status 1 when throughput dropped by more than
+--threshold compared to the stored results, which must have been measured
+with the same --scale, --seed and --jobs. Run from this directory:
+
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from analyzer import code_analyzer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+NAMES = ["alpha", "beta", "gamma", "delta", "value", "items", "result", "Total"]
+
+
+def random_line(rng, indent, long_lines=False, comments=False):
+    """One line of code, with a style issue every now and then."""
+    name = rng.choice(NAMES)
+    kind = rng.random()
+    if kind < 0.1:
+        line = f"def {name}_{rng.randrange(1000)}({rng.choice(NAMES)}, x=[]):"
+    elif kind < 0.15:
+        line = f"class {name.capitalize()}{rng.randrange(1000)}:"
+    elif kind < 0.25:
+        line = f"{name} = {rng.randrange(10**6)};"
+    else:
+        line = f"{name} = {rng.choice(NAMES)} + {rng.randrange(100)}"
+    if long_lines and rng.random() < 0.5:
+        line += " + " + " + ".join(rng.choice(NAMES) for _ in range(20))
+    if comments or rng.random() < 0.1:
+        line += rng.choice(["  # note", " # todo: tidy up", "  # " + "x" * 30])
+    return " " * indent + line
+
+
+def random_module(rng, lines, long_lines=False, comments=False):
+    """Syntactically valid source of about the given number of lines."""
+    out = []
+    indent = 0
+    while len(out) < lines:
+        if comments and rng.random() < 0.3:
+            out.append(" " * indent + "# " + " ".join(rng.choices(NAMES, k=8)))
+            continue
+        line = random_line(rng, indent, long_lines, comments)
+        out.append(line)
+        if line.rstrip().split("#")[0].rstrip().endswith(":"):
+            indent += 4
+            out.append(" " * indent + "pass")
+        elif indent and rng.random() < 0.2:
+            indent -= 4
+        if rng.random() < 0.05:
+            out.extend([""] * rng.randint(1, 4))
+    return "\n".join(out) + "\n"
+
+
+def write_file(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def generate_many_small(rng, root, scale):
+    for index in range(int(2000 * scale)):
+        package = f"pkg{index % 20}"
+        text = random_module(rng, rng.randint(10, 60))
+        write_file(os.path.join(root, package, f"module_{index}.py"), text)
+
+
+def generate_few_huge(rng, root, scale):
+    for index in range(3):
+        text = random_module(rng, int(50_000 * scale))
+        write_file(os.path.join(root, f"huge_{index}.py"), text)
+
+
+def generate_deep_tree(rng, root, scale):
+    for branch in range(max(1, int(10 * scale))):
+        path = os.path.join(root, f"branch{branch}")
+        for depth in range(30):
+            path = os.path.join(path, f"level{depth}")
+            write_file(os.path.join(path, "module.py"), random_module(rng, 20))
+
+
+def generate_comment_heavy(rng, root, scale):
+    for index in range(int(200 * scale)):
+        text = random_module(rng, 300, comments=True)
+        write_file(os.path.join(root, f"commented_{index}.py"), text)
+
+
+def generate_long_lines(rng, root, scale):
+    for index in range(int(200 * scale)):
+        text = random_module(rng, 300, long_lines=True)
+        write_file(os.path.join(root, f"long_{index}.py"), text)
+
+
+SCENARIOS = {
+    "many_small": generate_many_small,
+    "few_huge": generate_few_huge,
+    "deep_tree": generate_deep_tree,
+    "comment_heavy": generate_comment_heavy,
+    "long_lines": generate_long_lines,
+}
+
+
+def peak_rss_kib():
+    """Peak resident set size of this process and its finished children.
+
+    A high-water mark, so it's only taken for one scenario per process.
+    """
+    if resource is None:
+        return None
+    peak = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        peak = max(peak, resource.getrusage(who).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure_phases(paths, options):
+    """Seconds spent in each phase of analyze_file(), summed over paths."""
+    phases = dict.fromkeys(["read", "decode", "ast", "tokens", "lines"], 0.0)
+    lines = 0
+    for path in paths:
+        start = time.perf_counter()
+        with open(path, "rb") as file:
+            content = file.read()
+        read = time.perf_counter()
+        source = code_analyzer.decode(content)
+        decoded = time.perf_counter()
+        code_analyzer.syntax_tree_checks(source, options.rules)
+        parsed = time.perf_counter()
+        code_analyzer.token_checks(source, options.rules)
+        tokenized = time.perf_counter()
+        code_analyzer.batched_line_checks(source, options.rules)
+        scanned = time.perf_counter()
+
+        phases["read"] += read - start
+        phases["decode"] += decoded - read
+        phases["ast"] += parsed - decoded
+        phases["tokens"] += tokenized - parsed
+        phases["lines"] += scanned - tokenized
+        lines += source.count("\n")
+    return phases, lines
+
+
+def run_scenario(name, root, args):
+    """The results of scenario name, generated and measured in processes of their own.
+
+    A process starts with the peak RSS of the one it's forked from, so this
+    one is kept from growing by leaving the corpus generation to another.
+    """
+    benchmark = [sys.executable, __file__, "--scale", str(args.scale)]
+    benchmark += ["--seed", str(args.seed), "--jobs", str(args.jobs)]
+    subprocess.run([*benchmark, "--generate", name, root], check=True)
+    process = subprocess.run(
+        [*benchmark, "--measure", root], stdout=subprocess.PIPE, check=True
+    )
+    return json.loads(process.stdout)
+
+
+def generate(name, root, seed, scale):
+    # Seeded per scenario, so running one alone gives the same corpus
+    SCENARIOS[name](random.Random(f"{seed}:{name}"), root, scale)
+
+
+def measure(root, jobs, options):
+    """The results of analyzing root, run by run_scenario() in its process."""
+    paths = sorted(code_analyzer.discover_files(root))
+    with open(os.devnull, "w") as devnull:
+        reporter = code_analyzer.TextReporter(devnull)
+        start = time.perf_counter()
+        code_analyzer.analyze_directory(root, reporter, options, jobs=jobs)
+        reporter.close()
+        elapsed = time.perf_counter() - start
+    # Before measure_phases() reads every file again
+    peak_rss = peak_rss_kib()
+    phases, lines = measure_phases(paths, options)
+
+    return {
+        "files": len(paths),
+        "lines": lines,
+        "seconds": round(elapsed, 4),
+        "files_per_second": round(len(paths) / elapsed, 1),
+        "lines_per_second": round(lines / elapsed, 1),
+        "phase_seconds": {phase: round(value, 4) for phase, value in phases.items()},
+        "peak_rss_kib": peak_rss,
+    }
+
+
+# What the results depend on besides the code, stored along with them
+SETTINGS = ("scale", "seed", "jobs")
+
+
+def settings_mismatch(args, baseline):
+    """Why the results of a run with args can't be compared with baseline."""
+    if "scenarios" not in baseline:
+        return "it has no settings, store it again with --save-baseline"
+    for setting in SETTINGS:
+        if baseline[setting] != getattr(args, setting):
+            return (
+                f"it was measured with --{setting} {baseline[setting]}, "
+                f"not {getattr(args, setting)}"
+            )
+    return None
+
+
+def regressions(results, baseline, threshold):
+    """Descriptions of every throughput figure that fell below the baseline.
+
+    Raises ValueError when a scenario's corpus isn't the one measured for
+    the baseline, e.g. because the generator changed.
+    """
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for size in ("files", "lines"):
+            if result[size] != baseline[name][size]:
+                raise ValueError(
+                    f"{name} has {result[size]} {size}, "
+                    f"the baseline's corpus had {baseline[name][size]}"
+                )
+        for metric in ("files_per_second", "lines_per_second"):
+            expected = baseline[name][metric]
+            if result[metric] < expected * (1 - threshold):
+                found.append(
+                    f"{name}: {metric} {result[metric]} is more than "
+                    f"{threshold:.0%} below the baseline {expected}"
+                )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        choices=SCENARIOS,
+        action="append",
+        help="scenario to run, can be given several times (default: all)",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="corpus size multiplier"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="worker processes (default: 1)"
+    )
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed throughput drop against the baseline (default: 0.2)",
+    )
+    parser.add_argument(
+        "--save-baseline", metavar="PATH", help="store the results as the baseline"
+    )
+    # Used by run_scenario()
+    parser.add_argument("--generate", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--measure", metavar="ROOT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate(*args.generate, args.seed, args.scale)
+        return
+    if args.measure:
+        options = code_analyzer.AnalysisOptions()
+        print(json.dumps(measure(args.measure, args.jobs, options)))
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        mismatch = settings_mismatch(args, baseline)
+        if mismatch:
+            parser.error(f"can't compare with {args.baseline}: {mismatch}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as corpus:
+        for name in args.scenario or SCENARIOS:
+            results[name] = run_scenario(name, os.path.join(corpus, name), args)
+            print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    settings = {setting: getattr(args, setting) for setting in SETTINGS}
+    text = json.dumps({**settings, "scenarios": results}, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                file.write(text + "\n")
+
+    if baseline is not None:
+        try:
+            found = regressions(results, baseline["scenarios"], args.threshold)
+        except ValueError as exc:
+            parser.error(f"can't compare with {args.baseline}: {exc}")
+        for description in found:
+            print(f"REGRESSION {description}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import sys
+HEADER = """
+Not_code = 1
+def fake():
+    pass
+"""
+
+
+def First():
+    value = 1;  # todo
+    return value
+
+
+try:
+    import json
+except* ValueError:
+    Failed = 1
+else:
+    Bad = 1
+finally:
+    pass
+if sys.argv:
+    Cond = 1
+elif len(sys.argv) > 3:
+    pass
+else:
+    other = [
+1, 2,
+]
+@staticmethod
+def decorated(X):
+    return X
+total = 1 + \
+2
+class bad:
+    pass
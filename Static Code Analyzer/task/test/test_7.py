@@ -0,0 +1,22 @@
+text = "a; b  # todo"
+path = 'C:#dir;'
+print(text, path)  # a; b
+value = "#";
+
+
+def Multi_Line(
+    first,
+    second,
+):
+    return first + second
+
+
+class  multi_line(
+    object,
+):
+    pass
+
+
+def \
+        Split_name():
+    pass
@@ -1,6 +1,7 @@
 from hstest.stage_test import *
 from hstest.test_case import TestCase
-import os, re
+from analyzer import code_analyzer
+import os, random, re, subprocess, sys, tempfile
 
 TOO_LONG_LINE = 'Too long line is not mentioned. '
 error_code_long = "s001"
@@ -41,8 +42,14 @@ MUTABLE_ARG = "The program didn't warn about mutable function argument. "
 
 FALSE_ALARM = "False alarm. Your program warned about correct line. "
 
+BLOCKS = "Checking the file one top-level block at a time should find the same as checking it whole. "
+
 cur_dir = os.path.abspath(os.curdir)
 
+# test_1.py and test_6.py are over the size limit, get only the line and token checks
+SHARDED_ARGS = ["--no-cache", "--max-file-size", "300", f"test{os.sep}test_1.py", f"test{os.sep}test_2.py",
+                f"test{os.sep}test_6.py", f"test{os.sep}this_stage"]
+
 
 class AnalyzerTest(StageTest):
     def generate(self) -> List[TestCase]:
@@ -51,6 +58,10 @@ class AnalyzerTest(StageTest):
                 TestCase(args=[f"test{os.sep}this_stage{os.sep}test_3.py"], check_function=self.test_3),
                 TestCase(args=[f"test{os.sep}this_stage{os.sep}test_4.py"], check_function=self.test_4),
                 TestCase(args=[f"test{os.sep}this_stage{os.sep}test_5.py"], check_function=self.test_5),
+                TestCase(args=[f"test{os.sep}test_6.py"], check_function=self.test_6),
+                TestCase(args=[f"test{os.sep}test_7.py"], check_function=self.test_7),
+                TestCase(args=SHARDED_ARGS, check_function=self.test_sharded),
+                TestCase(args=["--per-line", f"test{os.sep}test_1.py"], check_function=self.test_per_line),
                 TestCase(args=[cur_dir + f"{os.sep}test{os.sep}this_stage"], check_function=self.test_common)]
 
     # Stages 1-2 tests
@@ -178,6 +189,113 @@ class AnalyzerTest(StageTest):
 
         return CheckResult.correct()
 
+    # Incremental analysis test
+    def test_6(self, output, attach):
+        file_path = f"test{os.sep}test_6.py"
+        output = output.strip().lower().splitlines()
+
+        expected = [(2, error_code_var_func_name), (9, error_code_func_name), (10, error_code_semicolon),
+                    (10, error_code_todo), (17, error_code_var_func_name), (19, error_code_var_func_name),
+                    (23, error_code_var_func_name), (31, error_code_arg_name), (35, error_code_class_name)]
+        if len(output) != len(expected):
+            return CheckResult.wrong("A wrong number of warning messages. "
+                                     f"Your program should warn about {len(expected)} mistakes in this test case")
+        for issue, (line, code) in zip(output, expected):
+            if not issue.startswith(f"{file_path}: line {line}: {code}"):
+                return CheckResult.wrong(f"Expected a warning {code} on line {line}, found {issue}")
+
+        # Lines at column 0 inside the string, the brackets and after the backslash,
+        # and the except*, else and elif branches don't start a block of their own
+        with open(file_path) as file:
+            source = file.read()
+        checked = code_analyzer.check_blocks(source)
+        if checked is None or checked[0] != code_analyzer.check_source(source):
+            return CheckResult.wrong(BLOCKS)
+
+        # The blocks after the edit are found again, on lines further down
+        edited = source.replace("def First():", "\n\ndef First():")
+        checked = code_analyzer.check_blocks(edited, known=checked[1])
+        if checked is None or checked[0] != code_analyzer.check_source(edited):
+            return CheckResult.wrong(BLOCKS + "The findings of unchanged blocks were reused wrongly. ")
+
+        return CheckResult.correct()
+
+    # Comments, semicolons and definitions as tokens test
+    def test_7(self, output, attach):
+        file_path = f"test{os.sep}test_7.py"
+        output = output.strip().lower().splitlines()
+        if not output:
+            return CheckResult.wrong("It looks like there is no messages from your program.")
+
+        for issue in output:
+            if (issue.startswith(f"{file_path}: line 1: ") or issue.startswith(f"{file_path}: line 2: ") or
+                    issue.startswith(f"{file_path}: line 3: ")):
+                return CheckResult.wrong(FALSE_ALARM + "The '#' or ';' was a part of the string. ")
+            if issue.startswith(f"{file_path}: line 4: {error_code_comments}"):
+                return CheckResult.wrong(FALSE_ALARM + "The '#' was a part of the string - not a comment. ")
+
+        if not len(output) == 5:
+            return CheckResult.wrong("A wrong number of warning messages. "
+                                     "Your program should warn about five mistakes in this test case")
+        if not output[0].startswith(f"{file_path}: line 4: {error_code_semicolon}"):
+            return CheckResult.wrong(UNNECESSARY_SEMICOLON)
+        # Definitions whose arguments span several lines
+        if not output[1].startswith(f"{file_path}: line 7: {error_code_func_name}"):
+            return CheckResult.wrong(FUNC_NAME)
+        if not output[2].startswith(f"{file_path}: line 14: {error_code_class_def_spaces}"):
+            return CheckResult.wrong(SPACES_AFTER_CLASS_FUNC)
+        if not output[3].startswith(f"{file_path}: line 14: {error_code_class_name}"):
+            return CheckResult.wrong(CLASS_NAME)
+        # The name is on the line after the backslash
+        if not output[4].startswith(f"{file_path}: line 21: {error_code_func_name}"):
+            return CheckResult.wrong(FUNC_NAME)
+
+        return CheckResult.correct()
+
+    # Line by line and whole-buffer line checks test
+    def test_per_line(self, output, attach):
+        process = subprocess.run([sys.executable, f"analyzer{os.sep}code_analyzer.py", f"test{os.sep}test_1.py"],
+                                 capture_output=True, text=True)
+        if output != process.stdout:
+            return CheckResult.wrong("--per-line should print the same as scanning the whole file. ")
+
+        # Long lines, indentation and blank lines made of all kinds of whitespace
+        pieces = [" ", "    ", "\t", "\x0c", "\u3000", "\xa0", "x", "é", "#", "a" * 40, "b" * 78]
+        rng = random.Random(0)
+        for _ in range(2000):
+            lines = ["".join(rng.choices(pieces, k=rng.randint(0, 5))) for _ in range(rng.randint(0, 12))]
+            source = "\n".join(lines) + rng.choice(["", "\n"])
+            # Only the line checks run on it, the rest needs source that parses
+            batched = code_analyzer.clean_errors(code_analyzer.batched_line_checks(source))
+            if batched != code_analyzer.clean_errors(code_analyzer.line_checks(source)):
+                return CheckResult.wrong(f"--per-line found something else in {source!r}. ")
+
+        return CheckResult.correct()
+
+    # Sharded run and merge test
+    def test_sharded(self, output, attach):
+        def run(*args):
+            process = subprocess.run([sys.executable, f"analyzer{os.sep}code_analyzer.py", *args],
+                                     capture_output=True, text=True)
+            return process.stdout, process.stderr
+
+        single = run(*SHARDED_ARGS)
+        if single[0] != output:
+            return CheckResult.wrong("The same run printed something else the second time. ")
+        if "degraded" not in single[1]:
+            return CheckResult.wrong("The files over --max-file-size weren't reported as degraded. ")
+
+        with tempfile.TemporaryDirectory() as directory:
+            partials = [os.path.join(directory, f"{index}.jsonl") for index in (1, 2)]
+            for index, partial in enumerate(partials, 1):
+                run("--shard", f"{index}/2", "--partial", partial, *SHARDED_ARGS)
+            merged = run("merge", *partials)
+        if merged != single:
+            return CheckResult.wrong("Merging the partial files of a sharded run should print "
+                                     "the same as a single run. ")
+
+        return CheckResult.correct()
+
     def test_common(self, output, attach):
         file_1 = f"test{os.sep}this_stage{os.sep}test_3.py"
         file_2 = f"test{os.sep}this_stage{os.sep}test_4.py"